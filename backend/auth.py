@@ -4,13 +4,22 @@ JWT-based auth with bcrypt password hashing.
 """
 
 import os
+import time
 from datetime import datetime, timedelta
+from functools import lru_cache
+from threading import Lock
 from typing import Optional
 
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+import bcrypt
+import jwt
+import orjson
+import redis
+from cachetools import TTLCache
+from jwt.exceptions import PyJWTError as JWTError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession, make_transient_to_detached, object_session
 from sqlmodel import Session, select
 
 from database import get_session
@@ -21,19 +30,41 @@ SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 72  # 3 days
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing — bcrypt cost factor; tune per deployment CPU.
+# Each hash/verify occupies one core for the full KDF, so login throughput
+# is capped at roughly (CPU cores / time per hash at this cost).
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# Hash prefixes written by bcrypt (and by passlib's bcrypt handler)
+BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
 
 # Bearer token extraction
 security = HTTPBearer(auto_error=False)
 
+# Cache of User rows for get_current_user (user_id -> field dict). Shared
+# across workers in Redis when REDIS_URL is set, so a write in one worker
+# invalidates it everywhere; otherwise per-worker.
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", "30"))
+REDIS_URL = os.environ.get("REDIS_URL", "")
+_redis = redis.Redis.from_url(REDIS_URL) if REDIS_URL else None
+_user_cache = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL)
+_user_cache_lock = Lock()
+# Credentials never go into the cache; they are lazy-loaded from the row if read
+UNCACHED_USER_FIELDS = frozenset({"password_hash"})
+
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    salt = bcrypt.gensalt(BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    # Existing passlib hashes are plain bcrypt strings, so they verify as-is
+    if not hashed_password or not hashed_password.startswith(BCRYPT_PREFIXES):
+        return False
+    try:
+        return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+    except ValueError:
+        return False
 
 
 def create_access_token(user_id: int, email: str) -> str:
@@ -47,16 +78,102 @@ def create_access_token(user_id: int, email: str) -> str:
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
+@lru_cache(maxsize=4096)
+def _decode_cached(token: str) -> dict:
+    """
+    Verify a token's signature once and remember its payload.
+    Failures raise and are not cached; expiry is re-checked on every use.
+    """
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
 def decode_token(token: str) -> dict:
     """Decode and validate a JWT token."""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        payload = _decode_cached(token)
     except JWTError:
+        payload = None
+    if payload is None or payload.get("exp", 0) <= time.time():
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
         )
+    return dict(payload)
+
+
+def _cache_get(user_id: int) -> Optional[dict]:
+    if _redis is not None:
+        try:
+            raw = _redis.get(f"user:{user_id}")
+        except redis.RedisError:
+            return None  # Redis down — fall back to the DB
+        return orjson.loads(raw) if raw is not None else None
+    with _user_cache_lock:
+        return _user_cache.get(user_id)
+
+
+def _cache_set(user_id: int, data: dict):
+    if _redis is not None:
+        try:
+            _redis.setex(f"user:{user_id}", USER_CACHE_TTL, orjson.dumps(data))
+        except redis.RedisError:
+            pass
+        return
+    with _user_cache_lock:
+        _user_cache[user_id] = data
+
+
+def invalidate_cached_user(user_id: int):
+    """Drop a user from the auth cache so the next request re-reads the row."""
+    if _redis is not None:
+        try:
+            _redis.delete(f"user:{user_id}")
+        except redis.RedisError:
+            pass
+        return
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+
+# User writes are evicted once their transaction commits: evicting at flush
+# would let a concurrent request re-cache the pre-commit row for the full TTL
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _on_user_write(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("written_user_ids", set()).add(target.id)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _evict_written_users(session):
+    for user_id in session.info.pop("written_user_ids", ()):
+        invalidate_cached_user(user_id)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _forget_written_users(session):
+    session.info.pop("written_user_ids", None)
+
+
+def _load_user(session: Session, user_id: int) -> Optional[User]:
+    """Fetch a user, serving repeat requests from the TTL cache."""
+    data = _cache_get(user_id)
+    if data is None:
+        user = session.get(User, user_id)
+        if user is not None:
+            _cache_set(user_id, user.model_dump(mode="json", exclude=UNCACHED_USER_FIELDS))
+        return user
+
+    # Rebuild as a clean, detached row and attach it without a SELECT,
+    # so endpoints can modify and commit it exactly like a loaded one.
+    # Uncached fields get placeholders, expired straight away so that they
+    # load from the database on first access and are never written back.
+    user = User.model_validate({**data, **dict.fromkeys(UNCACHED_USER_FIELDS, "")})
+    make_transient_to_detached(user)
+    user = session.merge(user, load=False)
+    session.expire(user, UNCACHED_USER_FIELDS)
+    return user
 
 
 def get_current_user(
@@ -76,7 +193,7 @@ def get_current_user(
     payload = decode_token(credentials.credentials)
     user_id = int(payload["sub"])
 
-    user = session.get(User, user_id)
+    user = _load_user(session, user_id)
     if not user or not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -5,6 +5,8 @@ Set DATABASE_URL env var for PostgreSQL.
 """
 
 import os
+from sqlalchemy import BigInteger, inspect
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import SQLModel, Session, create_engine, text
 
 # Default to SQLite for local development
@@ -14,10 +16,30 @@ DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///velowatt.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-# SQLite needs check_same_thread=False
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+# Every uvicorn worker (WEB_CONCURRENCY, uvicorn's --workers default) opens its
+# own pool, so the defaults split one connection budget between the workers —
+# 60 in total, well under Postgres's default max_connections of 100
+WEB_CONCURRENCY = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", "60"))
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", max(1, DB_MAX_CONNECTIONS // 3 // WEB_CONCURRENCY)))
+MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", max(0, DB_MAX_CONNECTIONS // WEB_CONCURRENCY - POOL_SIZE)))
 
-engine = create_engine(DATABASE_URL, echo=False, connect_args=connect_args)
+if DATABASE_URL.startswith("sqlite"):
+    # SQLite needs check_same_thread=False; pool sizing doesn't apply
+    engine = create_engine(
+        DATABASE_URL, echo=False, connect_args={"check_same_thread": False}
+    )
+else:
+    # Size the pool for concurrent requests and survive idle-killed connections
+    engine = create_engine(
+        DATABASE_URL,
+        echo=False,
+        connect_args={"application_name": os.environ.get("DB_APP_NAME", "velowatt")},
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+    )
 
 
 def init_db():
@@ -27,21 +49,72 @@ def init_db():
 
 
 def _run_migrations():
-    """Add new columns to existing tables if they don't exist."""
+    """Add new columns and indexes to existing tables if they don't exist."""
     migrations = [
         ("user", "coach_messages_used", "INTEGER DEFAULT 0"),
         ("user", "coach_week_start", "DATE"),
         ("user", "is_admin", "BOOLEAN DEFAULT FALSE"),
         ("user", "strava_athlete_id", "INTEGER"),
-        ("ride", "strava_activity_id", "INTEGER"),
+        ("user", "cached_ctl", "FLOAT"),
+        ("user", "cached_atl", "FLOAT"),
+        ("user", "cached_fitness_date", "DATE"),
+        ("user", "latest_ride_id", "INTEGER"),
+        ("ride", "strava_activity_id", "BIGINT"),
+        ("ride", "ai_prompt_hash", "VARCHAR(32)"),
+        ("ride", "ai_summary_stale", "BOOLEAN DEFAULT FALSE"),
     ]
-    with Session(engine) as session:
-        for table, column, col_type in migrations:
-            try:
-                session.exec(text(f"ALTER TABLE \"{table}\" ADD COLUMN {column} {col_type}"))
-                session.commit()
-            except Exception:
-                session.rollback()
+    # Read the current schema once and only ALTER what is actually missing
+    inspector = inspect(engine)
+    columns = {
+        table: {col["name"]: col["type"] for col in inspector.get_columns(table)}
+        for table in {table for table, _, _ in migrations}
+    }
+    existing = {table: set(cols) for table, cols in columns.items()}
+    pending = [m for m in migrations if m[1] not in existing[m[0]]]
+
+    # strava_activity_id started out as a 32-bit INTEGER; Strava ids no longer
+    # fit. SQLite's INTEGER is already 64-bit, so only widen it elsewhere.
+    widen_strava_id = (
+        engine.dialect.name != "sqlite"
+        and "strava_activity_id" in columns["ride"]
+        and not isinstance(columns["ride"]["strava_activity_id"], BigInteger)
+    )
+
+    # create_all() skips indexes on tables that already existed
+    missing_indexes = []
+    for table in SQLModel.metadata.sorted_tables:
+        existing_indexes = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        missing_indexes.extend(ix for ix in table.indexes if ix.name not in existing_indexes)
+
+    # Strava tokens used to be columns on user; move them to oauthtoken once
+    legacy_tokens = "strava_refresh_token" in existing["user"]
+
+    if not pending and not missing_indexes and not legacy_tokens and not widen_strava_id:
+        return
+
+    with engine.begin() as conn:
+        for table, column, col_type in pending:
+            conn.execute(text(f"ALTER TABLE \"{table}\" ADD COLUMN {column} {col_type}"))
+        if widen_strava_id:
+            conn.execute(text("ALTER TABLE ride ALTER COLUMN strava_activity_id TYPE BIGINT"))
+        if legacy_tokens:
+            conn.execute(text(
+                "INSERT INTO oauthtoken (user_id, provider, access_token, refresh_token, expires_at) "
+                "SELECT id, 'strava', strava_access_token, strava_refresh_token, strava_expires_at "
+                "FROM \"user\" WHERE strava_refresh_token IS NOT NULL "
+                "AND id NOT IN (SELECT user_id FROM oauthtoken WHERE provider = 'strava')"
+            ))
+            for column in ("strava_access_token", "strava_refresh_token", "strava_expires_at"):
+                conn.execute(text(f"ALTER TABLE \"user\" DROP COLUMN {column}"))
+
+    # One transaction per index: a unique index that existing rows violate is
+    # skipped (and retried next startup) instead of blocking the app from starting
+    for index in missing_indexes:
+        try:
+            with engine.begin() as conn:
+                index.create(conn)
+        except IntegrityError:
+            pass
 
 
 def get_session():
@@ -0,0 +1,71 @@
+"""
+Numeric kernels for per-sample ride data.
+
+The hot loops over second-by-second samples (elevation gain, the
+normalized-power rolling mean) are compiled with Numba when it is
+installed (pip install numba). Without Numba, equivalent NumPy
+implementations are used, so results don't depend on the deploy.
+
+Kernels take 1-D NumPy arrays with no missing values and return
+unrounded floats; callers handle NaN filtering and rounding.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+HAVE_NUMBA = njit is not None
+
+
+if HAVE_NUMBA:
+    # cache=True keeps the compiled code in __pycache__ across restarts,
+    # so the JIT cost is paid once per deploy rather than once per process.
+
+    @njit(cache=True, fastmath=True)
+    def elevation_gain(altitude):
+        """Sum of positive altitude deltas, in the input's units."""
+        gain = 0.0
+        for i in range(1, altitude.size):
+            diff = altitude[i] - altitude[i - 1]
+            if diff > 0:
+                gain += diff
+        return gain
+
+    @njit(cache=True, fastmath=True)
+    def normalized_power(power, window):
+        """4th root of the mean 4th power of the `window`-sample rolling mean."""
+        count = power.size - window + 1
+        if count <= 0:
+            return 0.0
+        # Running window sum: one add and one subtract per sample instead of
+        # re-summing all `window` samples, and no intermediate arrays
+        segment = 0.0
+        for j in range(window):
+            segment += power[j]
+        inv_window = 1.0 / window
+        avg = segment * inv_window
+        total = avg * avg * avg * avg
+        for i in range(window, power.size):
+            segment += power[i] - power[i - window]
+            avg = segment * inv_window
+            total += avg * avg * avg * avg
+        return (total / count) ** 0.25
+
+else:
+
+    def elevation_gain(altitude):
+        """Sum of positive altitude deltas, in the input's units."""
+        return float(np.maximum(np.diff(altitude), 0).sum())
+
+    def normalized_power(power, window):
+        """4th root of the mean 4th power of the `window`-sample rolling mean."""
+        if power.size < window:
+            return 0.0
+        csum = np.concatenate(([0.0], np.cumsum(power, dtype=np.float64)))
+        rolling = (csum[window:] - csum[:-window]) / window
+        # Square in place, then sum(r**4) as one dot product — no 4th-power array
+        np.multiply(rolling, rolling, out=rolling)
+        return float((np.dot(rolling, rolling) / rolling.size) ** 0.25)
@@ -8,22 +8,60 @@ Extracts ride data from Garmin .FIT files:
 - Lap summaries
 - Session totals
 
-Uses the `fitparse` library (pip install fitparse)
+Uses the `fitdecode` library (pip install fitdecode)
 
 Supported Garmin devices: Edge series, Forerunner, Fenix, etc.
 Also works with .FIT files exported from Wahoo, Hammerhead, etc.
 """
 
-from datetime import datetime, date, timedelta
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date, timedelta, timezone
 from typing import Optional
 from dataclasses import dataclass, field
 
-from fitparse import FitFile
+import fitdecode
+import numpy as np
+
+import fit_numeric
+
+# Parsing is CPU-bound and holds the GIL; worker processes keep it off the
+# web worker. The pool is created on first use, and its workers come from a
+# forkserver: forking the threaded web process directly can deadlock.
+FIT_WORKERS = int(os.environ.get("FIT_WORKERS", "2"))
+_FIT_POOL: Optional[ProcessPoolExecutor] = None
+_FIT_POOL_LOCK = threading.Lock()
+
+
+def _fit_pool() -> ProcessPoolExecutor:
+    global _FIT_POOL
+    with _FIT_POOL_LOCK:
+        if _FIT_POOL is None:
+            _FIT_POOL = ProcessPoolExecutor(
+                max_workers=FIT_WORKERS, mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return _FIT_POOL
+
+
+def shutdown_fit_pool():
+    """Stop the FIT worker processes, if any were started (app shutdown)."""
+    global _FIT_POOL
+    with _FIT_POOL_LOCK:
+        if _FIT_POOL is not None:
+            _FIT_POOL.shutdown(cancel_futures=True)
+            _FIT_POOL = None
 
 
 @dataclass
 class FitRecord:
-    """A single data point from the ride (typically 1-second interval)."""
+    """
+    A single data point from the ride (typically 1-second interval).
+    Not stored per sample — built on demand when indexing a FitSeries.
+    """
     timestamp: Optional[datetime] = None
     power: Optional[float] = None
     heart_rate: Optional[int] = None
@@ -36,6 +74,85 @@ class FitRecord:
     temperature: Optional[float] = None    # Celsius
 
 
+# Per-sample channels held by FitSeries (same order as FitRecord fields)
+SERIES_CHANNELS = (
+    "timestamp", "power", "heart_rate", "cadence", "speed",
+    "altitude", "distance", "latitude", "longitude", "temperature",
+)
+# fitdecode's default processor reports GPS positions as integer semicircles
+SEMICIRCLES_TO_DEGREES = 180.0 / (1 << 31)
+_SERIES_INITIAL_CAPACITY = 18_000   # 5 hours at 1 Hz — most rides never regrow
+
+
+@dataclass
+class FitSeries:
+    """
+    Second-by-second ride data stored column-wise.
+    
+    One float64 array per channel, NaN where a record had no value.
+    Timestamps are UTC epoch seconds. Buffers double when full while
+    parsing; finish() trims them to the number of samples pushed.
+    """
+    timestamp: np.ndarray = field(default_factory=lambda: np.empty(0))
+    power: np.ndarray = field(default_factory=lambda: np.empty(0))
+    heart_rate: np.ndarray = field(default_factory=lambda: np.empty(0))
+    cadence: np.ndarray = field(default_factory=lambda: np.empty(0))
+    speed: np.ndarray = field(default_factory=lambda: np.empty(0))         # m/s
+    altitude: np.ndarray = field(default_factory=lambda: np.empty(0))      # meters
+    distance: np.ndarray = field(default_factory=lambda: np.empty(0))      # meters (cumulative)
+    latitude: np.ndarray = field(default_factory=lambda: np.empty(0))
+    longitude: np.ndarray = field(default_factory=lambda: np.empty(0))
+    temperature: np.ndarray = field(default_factory=lambda: np.empty(0))   # Celsius
+    size: int = 0
+    
+    def push(self, values: dict):
+        """Append one sample; channels missing from `values` are stored as NaN."""
+        if self.size == len(self.timestamp):
+            self._grow()
+        i = self.size
+        for name in SERIES_CHANNELS:
+            value = values.get(name)
+            getattr(self, name)[i] = np.nan if value is None else value
+        self.size += 1
+    
+    def finish(self):
+        """Trim the growth buffers down to the samples actually pushed."""
+        for name in SERIES_CHANNELS:
+            setattr(self, name, getattr(self, name)[:self.size].copy())
+    
+    def _grow(self):
+        capacity = max(2 * len(self.timestamp), _SERIES_INITIAL_CAPACITY)
+        for name in SERIES_CHANNELS:
+            buffer = np.empty(capacity)
+            buffer[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, buffer)
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    def __getitem__(self, i: int) -> FitRecord:
+        if not -self.size <= i < self.size:
+            raise IndexError("FitSeries index out of range")
+        # Count from the last pushed sample, not the end of the spare capacity
+        if i < 0:
+            i += self.size
+        row = {}
+        for name in SERIES_CHANNELS:
+            value = float(getattr(self, name)[i])
+            row[name] = None if np.isnan(value) else value
+        rec = FitRecord(**row)
+        if rec.timestamp is not None:
+            rec.timestamp = _from_epoch_seconds(rec.timestamp)
+        if rec.heart_rate is not None:
+            rec.heart_rate = int(rec.heart_rate)
+        if rec.cadence is not None:
+            rec.cadence = int(rec.cadence)
+        return rec
+    
+    def __iter__(self):
+        return (self[i] for i in range(self.size))
+
+
 @dataclass
 class FitLap:
     """Summary data for a single lap."""
@@ -75,9 +192,11 @@ class FitRideData:
     # Raw data for NP calculation
     power_data: list[float] = field(default_factory=list)
     heart_rate_data: list[int] = field(default_factory=list)
+    power_array: Optional[np.ndarray] = None   # power_data as float32
+    normalized_power: Optional[float] = None   # None if < 30 samples
     
-    # Detailed records and laps
-    records: list[FitRecord] = field(default_factory=list)
+    # Detailed records (column-wise) and laps
+    records: FitSeries = field(default_factory=FitSeries)
     laps: list[FitLap] = field(default_factory=list)
     
     # Sample rate (seconds between records)
@@ -88,168 +207,185 @@ class FitRideData:
     device_manufacturer: Optional[str] = None
 
 
-def parse_fit_file(file_path: str) -> FitRideData:
+def parse_fit_file(file_path: str, keep_records: bool = False) -> FitRideData:
     """
     Parse a .FIT file and extract all ride data.
     
     Args:
         file_path: Path to the .FIT file
+        keep_records: Keep the per-sample series in `records`
     
     Returns:
         FitRideData with all extracted data
     """
-    fitfile = FitFile(file_path)
-    return _parse_fitfile(fitfile)
+    with fitdecode.FitReader(file_path) as fitfile:
+        return _parse_fitfile(fitfile, keep_records)
 
 
-def _parse_fitfile(fitfile) -> FitRideData:
-    """Parse a FitFile object and extract all ride data."""
+def _parse_fitfile(fitfile: fitdecode.FitReader, keep_records: bool = False) -> FitRideData:
+    """Parse an open FitReader and extract all ride data."""
     ride = FitRideData()
     
-    records = []
-    timestamps = []
-    
-    for record in fitfile.get_messages():
-        msg_type = record.name
-        
-        if msg_type == "record":
-            rec = _parse_record(record)
-            if rec:
-                records.append(rec)
-                if rec.power is not None:
-                    ride.power_data.append(rec.power)
-                else:
-                    ride.power_data.append(0.0)
-                if rec.heart_rate is not None:
-                    ride.heart_rate_data.append(rec.heart_rate)
-                if rec.timestamp:
-                    timestamps.append(rec.timestamp)
-        
-        elif msg_type == "lap":
-            lap = _parse_lap(record)
-            if lap:
-                ride.laps.append(lap)
-        
-        elif msg_type == "session":
-            _parse_session(record, ride)
-        
-        elif msg_type == "device_info":
-            _parse_device_info(record, ride)
-    
-    ride.records = records
-    
-    # Determine sample rate from timestamps
-    if len(timestamps) >= 2:
-        deltas = []
-        for i in range(1, min(20, len(timestamps))):
-            dt = (timestamps[i] - timestamps[i-1]).total_seconds()
-            if 0 < dt <= 10:  # Reasonable range
-                deltas.append(dt)
-        if deltas:
-            ride.sample_rate_seconds = max(1, round(sum(deltas) / len(deltas)))
+    series = FitSeries()
     
-    # If session data is missing, calculate from records
-    if ride.duration_seconds == 0 and len(timestamps) >= 2:
-        ride.duration_seconds = int((timestamps[-1] - timestamps[0]).total_seconds())
+    for record in fitfile:
+        if record.frame_type != fitdecode.FIT_FRAME_DATA:
+            continue
+        handler = _HANDLERS.get(record.name)
+        if handler is not None:
+            handler(record, ride, series)
     
-    if ride.start_time is None and timestamps:
-        ride.start_time = timestamps[0]
-        ride.ride_date = timestamps[0].date()
+    series.finish()
+    series.latitude *= SEMICIRCLES_TO_DEGREES
+    series.longitude *= SEMICIRCLES_TO_DEGREES
+    timestamps = series.timestamp[~np.isnan(series.timestamp)]
     
-    if ride.avg_power == 0 and ride.power_data:
-        non_zero = [p for p in ride.power_data if p > 0]
-        ride.avg_power = round(sum(non_zero) / len(non_zero), 1) if non_zero else 0
+    # Power/HR lists derived once from the series (missing power counts as 0 W)
+    pw = np.nan_to_num(series.power, nan=0.0).astype(np.float32)
+    hr = series.heart_rate[~np.isnan(series.heart_rate)].astype(np.int32)
+    ride.power_data = pw.tolist()
+    ride.heart_rate_data = hr.tolist()
     
-    if ride.max_power == 0 and ride.power_data:
-        ride.max_power = max(ride.power_data)
+    # Determine sample rate from timestamps. Median over the whole ride, so
+    # a slow GPS lock or pauses at the start don't skew it.
+    if len(timestamps) >= 2:
+        deltas = np.diff(timestamps)
+        deltas = deltas[(deltas > 0) & (deltas <= 10)]  # Reasonable range
+        if deltas.size:
+            ride.sample_rate_seconds = max(1, round(float(np.median(deltas))))
+    
+    # If session data is missing, calculate from records
+    if ride.duration_seconds == 0 and len(timestamps) >= 2:
+        ride.duration_seconds = int(timestamps[-1] - timestamps[0])
     
-    if ride.avg_heart_rate is None and ride.heart_rate_data:
-        ride.avg_heart_rate = round(sum(ride.heart_rate_data) / len(ride.heart_rate_data), 1)
+    if ride.start_time is None and len(timestamps):
+        ride.start_time = _from_epoch_seconds(timestamps[0])
+        ride.ride_date = ride.start_time.date()
     
-    if ride.max_heart_rate is None and ride.heart_rate_data:
-        ride.max_heart_rate = max(ride.heart_rate_data)
+    if pw.size:
+        ride.power_array = pw
+        ride.normalized_power = _normalized_power(pw, ride.sample_rate_seconds)
+        if ride.avg_power == 0:
+            non_zero = pw[pw > 0]
+            ride.avg_power = round(float(non_zero.mean()), 1) if non_zero.size else 0
+        if ride.max_power == 0:
+            ride.max_power = float(pw.max())
+    
+    if hr.size:
+        if ride.avg_heart_rate is None:
+            ride.avg_heart_rate = round(float(hr.mean()), 1)
+        if ride.max_heart_rate is None:
+            ride.max_heart_rate = int(hr.max())
     
     # Calculate elevation gain from altitude data
     if ride.elevation_gain_m == 0:
-        altitudes = [r.altitude for r in records if r.altitude is not None]
-        if altitudes:
-            gain = 0
-            for i in range(1, len(altitudes)):
-                diff = altitudes[i] - altitudes[i-1]
-                if diff > 0:
-                    gain += diff
-            ride.elevation_gain_m = round(gain, 1)
+        altitudes = series.altitude[~np.isnan(series.altitude)]
+        if altitudes.size:
+            gain = fit_numeric.elevation_gain(altitudes)
+            ride.elevation_gain_m = round(float(gain), 1)
+    
+    # Summary callers never read the samples; don't hold (or pickle) them
+    if keep_records:
+        ride.records = series
     
     return ride
 
 
-def parse_fit_bytes(file_bytes: bytes) -> FitRideData:
+def _normalized_power(power: np.ndarray, sample_rate_seconds: int) -> Optional[float]:
+    """
+    NP from a power array via the fit_numeric rolling-mean kernel.
+    Same window and minimum-length rules as metrics.calculate_normalized_power.
+    """
+    window = max(1, 30 // sample_rate_seconds)
+    if power.size < max(30, window):
+        return None
+    return round(float(fit_numeric.normalized_power(power, window)), 1)
+
+
+def parse_fit_bytes(file_bytes: bytes, keep_records: bool = False) -> FitRideData:
     """
     Parse .FIT file from bytes (for file upload handling).
     
     Args:
         file_bytes: Raw bytes of the .FIT file
+        keep_records: Keep the per-sample series in `records`
     
     Returns:
         FitRideData with all extracted data
     """
-    import os
-    import io
-    
-    # Try parsing directly from BytesIO first (avoids temp file issues on Windows)
-    try:
-        fitfile = FitFile(io.BytesIO(file_bytes))
-        fitfile.parse()
-        return _parse_fitfile(fitfile)
-    except Exception:
-        pass
-    
-    # Fallback: write to a regular file in the current directory
-    tmp_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"_temp_import.fit")
-    try:
-        with open(tmp_path, "wb") as f:
-            f.write(file_bytes)
-        return parse_fit_file(tmp_path)
-    finally:
-        try:
-            os.unlink(tmp_path)
-        except OSError:
-            pass
-
-
-def _parse_record(record) -> Optional[FitRecord]:
-    """Parse a single data record message."""
-    data = _get_values(record)
+    with fitdecode.FitReader(io.BytesIO(file_bytes)) as fitfile:
+        return _parse_fitfile(fitfile, keep_records)
+
+
+async def parse_fit_file_async(file_path: str, keep_records: bool = False) -> FitRideData:
+    """parse_fit_file in the FIT worker pool — only the path crosses the process boundary."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_fit_pool(), parse_fit_file, file_path, keep_records)
+
+
+async def parse_fit_bytes_async(file_bytes: bytes, keep_records: bool = False) -> FitRideData:
+    """parse_fit_bytes in the FIT worker pool, without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_fit_pool(), parse_fit_bytes, file_bytes, keep_records)
+
+
+# Fields each message parser reads — everything else is skipped in _get_values
+_RECORD_FIELDS = frozenset({
+    "timestamp", "power", "heart_rate", "cadence", "speed", "enhanced_speed",
+    "altitude", "enhanced_altitude", "distance", "position_lat", "position_long",
+    "temperature",
+})
+_LAP_FIELDS = frozenset({
+    "start_time", "total_timer_time", "total_distance", "avg_power", "max_power",
+    "avg_heart_rate", "max_heart_rate", "avg_cadence", "avg_speed", "enhanced_avg_speed",
+})
+_SESSION_FIELDS = frozenset({
+    "sport", "start_time", "total_timer_time", "total_distance", "total_ascent",
+    "total_calories", "avg_power", "max_power", "avg_heart_rate", "max_heart_rate",
+    "avg_cadence", "avg_speed", "enhanced_avg_speed",
+})
+_DEVICE_INFO_FIELDS = frozenset({"manufacturer", "product_name", "garmin_product"})
+
+# FitSeries channel -> record fields to try, first non-None wins
+_RECORD_MAP = (
+    ("power", ("power",)),
+    ("heart_rate", ("heart_rate",)),
+    ("cadence", ("cadence",)),
+    ("speed", ("speed", "enhanced_speed")),
+    ("altitude", ("altitude", "enhanced_altitude")),
+    ("distance", ("distance",)),
+    ("temperature", ("temperature",)),
+)
+
+
+def _parse_record(record) -> Optional[dict]:
+    """Parse a single data record message into FitSeries channel values."""
+    data = _get_values(record, _RECORD_FIELDS)
     if not data:
         return None
     
-    rec = FitRecord()
-    rec.timestamp = data.get("timestamp")
-    rec.power = data.get("power")
-    rec.heart_rate = data.get("heart_rate")
-    rec.cadence = data.get("cadence")
-    rec.speed = data.get("speed")  # Enhanced speed or speed
-    if rec.speed is None:
-        rec.speed = data.get("enhanced_speed")
-    rec.altitude = data.get("altitude")
-    if rec.altitude is None:
-        rec.altitude = data.get("enhanced_altitude")
-    rec.distance = data.get("distance")
-    rec.temperature = data.get("temperature")
-    
-    # GPS â€” fitparse stores as semicircles, convert to degrees
+    timestamp = data.get("timestamp")
+    values = {"timestamp": _epoch_seconds(timestamp) if timestamp else None}
+    for channel, keys in _RECORD_MAP:
+        for key in keys:
+            value = data.get(key)
+            if value is not None:
+                values[channel] = value
+                break
+    
+    # GPS â€” raw semicircles; converted to degrees for the whole series later
     lat = data.get("position_lat")
     lon = data.get("position_long")
     if lat is not None and lon is not None:
-        rec.latitude = lat * (180.0 / 2**31) if isinstance(lat, int) else lat
-        rec.longitude = lon * (180.0 / 2**31) if isinstance(lon, int) else lon
+        values["latitude"] = lat
+        values["longitude"] = lon
     
-    return rec
+    return values
 
 
 def _parse_lap(record) -> Optional[FitLap]:
     """Parse a lap summary message."""
-    data = _get_values(record)
+    data = _get_values(record, _LAP_FIELDS)
     if not data:
         return None
     
@@ -272,7 +408,7 @@ def _parse_lap(record) -> Optional[FitLap]:
 
 def _parse_session(record, ride: FitRideData):
     """Parse session summary message (overall ride totals)."""
-    data = _get_values(record)
+    data = _get_values(record, _SESSION_FIELDS)
     if not data:
         return
     
@@ -302,7 +438,7 @@ def _parse_session(record, ride: FitRideData):
 
 def _parse_device_info(record, ride: FitRideData):
     """Parse device info message."""
-    data = _get_values(record)
+    data = _get_values(record, _DEVICE_INFO_FIELDS)
     if not data:
         return
     
@@ -315,13 +451,53 @@ def _parse_device_info(record, ride: FitRideData):
         ride.device_name = str(product_name)
 
 
-def _get_values(record) -> dict:
-    """Extract field values from a FIT record message."""
-    values = {}
-    for field_data in record.fields:
-        if field_data.value is not None:
-            values[field_data.name] = field_data.value
-    return values
+def _handle_record(record, ride: FitRideData, series: FitSeries):
+    values = _parse_record(record)
+    if values:
+        series.push(values)
+
+
+def _handle_lap(record, ride: FitRideData, series: FitSeries):
+    lap = _parse_lap(record)
+    if lap:
+        ride.laps.append(lap)
+
+
+def _handle_session(record, ride: FitRideData, series: FitSeries):
+    _parse_session(record, ride)
+
+
+def _handle_device_info(record, ride: FitRideData, series: FitSeries):
+    _parse_device_info(record, ride)
+
+
+# Message name -> handler; other message types are ignored
+_HANDLERS = {
+    "record": _handle_record,
+    "lap": _handle_lap,
+    "session": _handle_session,
+    "device_info": _handle_device_info,
+}
+
+
+def _epoch_seconds(ts: datetime) -> float:
+    """Seconds since the Unix epoch; naive FIT timestamps are UTC."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def _from_epoch_seconds(seconds: float) -> datetime:
+    """Inverse of _epoch_seconds — aware UTC, like fitdecode's timestamps."""
+    return datetime.fromtimestamp(float(seconds), timezone.utc)
+
+
+def _get_values(record, keep: frozenset) -> dict:
+    """Extract the non-empty fields named in `keep` from a FIT message."""
+    return {
+        f.name: f.value for f in record.fields
+        if f.value is not None and f.name in keep
+    }
 
 
 def fit_data_to_ride_dict(fit_data: FitRideData) -> dict:
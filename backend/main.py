@@ -5,12 +5,22 @@ Multi-user cycling performance analytics platform.
 FastAPI + PostgreSQL + JWT Auth.
 """
 
+import asyncio
+import hashlib
 import os
+import secrets
+import shutil
 import sys
+import tempfile
+import time
 from pathlib import Path
 from datetime import date, datetime, timedelta
+from functools import lru_cache
+from threading import Lock
 from typing import Optional
-from collections import defaultdict
+
+import httpx
+import numpy as np
 
 # Ensure local modules are importable
 sys.path.insert(0, str(Path(__file__).parent))
@@ -22,35 +32,50 @@ try:
 except ImportError:
     pass
 
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, status
+from anyio import to_thread
+from cachetools import TTLCache
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, BackgroundTasks, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
-from sqlmodel import Session, select
+from pydantic import BaseModel
+from sqlalchemy import Date, event, literal_column
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select, func, delete, update, cast
 
-from database import init_db, get_session, engine
+from database import init_db, get_session, engine, WEB_CONCURRENCY, POOL_SIZE, MAX_OVERFLOW
 from models import (
-    User, UserRegister, UserLogin,
+    User, UserRegister, UserLogin, OAuthToken,
     Ride, RideCreate,
     UserSettings, UserSettingsUpdate,
 )
 from auth import (
     hash_password, verify_password, create_access_token,
-    get_current_user,
+    get_current_user, REDIS_URL,
 )
 from metrics import (
     calculate_ride_metrics,
+    calculate_ride_metrics_batch,
     calculate_normalized_power,
     calculate_tss_simple,
     calculate_ctl,
     calculate_atl,
     calculate_tsb,
+    calculate_load_series,
     get_power_zones,
 )
-from fit_parser import parse_fit_bytes, fit_data_to_ride_dict
+from fit_parser import parse_fit_file_async, fit_data_to_ride_dict, shutdown_fit_pool
 
-ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", "http://localhost:8000,http://localhost:3000,https://velowatt.app").split(",")
+# Normalized once: "a, b/" must match the Origin header browsers send ("b", no slash)
+ALLOWED_ORIGINS = tuple(
+    origin.strip().rstrip("/")
+    for origin in os.environ.get("ALLOWED_ORIGINS", "http://localhost:8000,http://localhost:3000,https://velowatt.app").split(",")
+    if origin.strip()
+)
 
-app = FastAPI(title="VeloWatt API", version="1.0.0")
+# orjson encodes the long power/HR arrays in ride payloads far faster than json
+app = FastAPI(title="VeloWatt API", version="1.0.0", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -61,9 +86,37 @@ app.add_middleware(
 )
 
 
+# Shared HTTP clients for Anthropic and Strava: pooled keep-alive connections
+# (HTTP/2 where offered) instead of a new TCP + TLS handshake on every call
+http_client = httpx.Client(
+    http2=True, timeout=30, limits=httpx.Limits(max_keepalive_connections=32),
+)
+async_http_client = httpx.AsyncClient(
+    http2=True, timeout=30, limits=httpx.Limits(max_connections=20),
+)
+
+
+# Sync endpoints run on AnyIO's worker threads, 40 by default. Allow as many
+# as the DB pool has connections (DB_POOL_SIZE + DB_MAX_OVERFLOW) so a burst
+# of requests queues on the database, not on the threadpool.
+THREADPOOL_SIZE = int(os.environ.get("THREADPOOL_SIZE", POOL_SIZE + MAX_OVERFLOW))
+
+
 @app.on_event("startup")
 def on_startup():
+    # The auth user cache is per process unless it lives in Redis; with several
+    # workers a settings write in one would leave the others on the old row
+    if WEB_CONCURRENCY > 1 and not REDIS_URL:
+        raise RuntimeError("WEB_CONCURRENCY > 1 needs REDIS_URL for the shared user cache")
     init_db()
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    shutdown_fit_pool()
+    http_client.close()
+    await async_http_client.aclose()
 
 
 # ═══════════════════════════════════════
@@ -143,10 +196,18 @@ def update_settings(
     user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
+    user = _lock_user(session, user.id)
     if data.name is not None:
         user.name = data.name
-    if data.ftp is not None:
+    if data.ftp is not None and data.ftp != user.ftp:
         user.ftp = data.ftp
+        # The analysis prompts quote the current FTP
+        session.exec(
+            update(Ride)
+            .where(Ride.user_id == user.id, Ride.ai_summary.is_not(None))
+            .values(ai_summary_stale=True)
+            .execution_options(synchronize_session=False)
+        )
     if data.weight_kg is not None:
         user.weight_kg = data.weight_kg
     if data.resting_hr is not None:
@@ -167,30 +228,53 @@ def recalculate_all_rides(
     user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
+    user = _lock_user(session, user.id)
     ftp = user.ftp
-    rides = session.exec(
-        select(Ride).where(Ride.user_id == user.id).order_by(Ride.ride_date)
-    ).all()
 
-    updated = 0
-    for ride in rides:
-        np_val = ride.normalized_power or ride.avg_power
-        metrics = calculate_ride_metrics(
-            duration_seconds=ride.duration_seconds,
-            avg_power=ride.avg_power,
+    # Same formulas and rounding as calculate_ride_metrics, over every ride at
+    # once; only the columns they need are loaded, not whole Ride rows
+    rows = session.exec(
+        select(
+            Ride.id, Ride.duration_seconds, Ride.avg_power, Ride.normalized_power,
+            Ride.avg_heart_rate, Ride.ai_summary.is_not(None),
+        ).where(Ride.user_id == user.id)
+    ).all()
+    if rows:
+        ride_ids, duration, avg_power, np_values, avg_hr, has_summary = zip(*rows)
+        metrics = calculate_ride_metrics_batch(
+            duration_seconds=duration,
+            avg_power=avg_power,
             ftp=ftp,
-            normalized_power=np_val,
-            avg_heart_rate=ride.avg_heart_rate,
+            normalized_power=np_values,
+            avg_heart_rate=avg_hr,
         )
-        ride.tss = metrics["tss"]
-        ride.intensity_factor = metrics["intensity_factor"]
-        ride.variability_index = metrics.get("variability_index")
-        ride.efficiency_factor = metrics.get("efficiency_factor")
-        ride.ftp_at_time = ftp
-        session.add(ride)
-        updated += 1
+        # One executemany UPDATE keyed by primary key
+        session.exec(update(Ride), params=[
+            {
+                "id": ride_id,
+                "tss": tss,
+                "intensity_factor": if_value,
+                "variability_index": vi,
+                "efficiency_factor": None if np.isnan(ef) else ef,
+                "ftp_at_time": ftp,
+                "ai_summary_stale": stale,
+            }
+            for ride_id, tss, if_value, vi, ef, stale in zip(
+                ride_ids,
+                metrics["tss"].tolist(),
+                metrics["intensity_factor"].tolist(),
+                metrics["variability_index"].tolist(),
+                metrics["efficiency_factor"].tolist(),
+                has_summary,
+            )
+        ])
+    updated = len(rows)
 
+    # Every TSS changed — replay the history once
+    session.flush()
+    _recompute_fitness_cache(session, user)
     session.commit()
+    invalidate_coach_context(user.id)
     return {"rides_updated": updated, "ftp_used": ftp}
 
 
@@ -235,9 +319,13 @@ def create_ride(
         avg_cadence=ride_data.avg_cadence,
     )
     session.add(ride)
+    _update_fitness_cache(session, user.id, [(ride.ride_date, ride.tss)])
+    session.flush()
+    user.latest_ride_id = ride.id
+    session.add(user)
     session.commit()
     session.refresh(ride)
-    return {**ride.dict(), **metrics}
+    return ORJSONResponse({**ride.model_dump(), **metrics})
 
 
 @app.get("/api/rides")
@@ -253,7 +341,13 @@ def list_rides(
         .order_by(Ride.ride_date.desc())
         .offset(offset).limit(limit)
     ).all()
-    return rides
+    # Encode the rows straight with orjson, skipping jsonable_encoder
+    return ORJSONResponse([ride.model_dump() for ride in rides])
+
+
+def _get_user_ride(session: Session, ride_id: int, user_id: int) -> Optional[Ride]:
+    """A ride by id, only if it belongs to the user (others' rides look missing)."""
+    return session.exec(select(Ride).where(Ride.id == ride_id, Ride.user_id == user_id)).first()
 
 
 @app.get("/api/rides/{ride_id}")
@@ -262,8 +356,8 @@ def get_ride(
     user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
-    ride = session.get(Ride, ride_id)
-    if not ride or ride.user_id != user.id:
+    ride = _get_user_ride(session, ride_id, user.id)
+    if not ride:
         raise HTTPException(status_code=404, detail="Ride not found")
     return ride
 
@@ -274,14 +368,155 @@ def delete_ride(
     user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
-    ride = session.get(Ride, ride_id)
-    if not ride or ride.user_id != user.id:
+    # Ownership is part of the WHERE, and RETURNING hands back what the
+    # fitness cache needs — one statement, no fetch first
+    deleted = session.exec(
+        delete(Ride)
+        .where(Ride.id == ride_id, Ride.user_id == user.id)
+        .returning(Ride.ride_date, Ride.tss)
+    ).first()
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Ride not found")
-    session.delete(ride)
+    _update_fitness_cache(session, user.id, [(deleted.ride_date, -deleted.tss)])
+    if user.latest_ride_id == ride_id:
+        user.latest_ride_id = None
+        session.add(user)
     session.commit()
+    invalidate_coach_context(user.id)
     return {"message": "Ride deleted", "id": ride_id}
 
 
+# ═══════════════════════════════════════
+# TRAINING LOAD
+# ═══════════════════════════════════════
+
+# One rest day (TSS 0) multiplies CTL/ATL by (N-1)/N
+CTL_DECAY = 41 / 42
+ATL_DECAY = 6 / 7
+
+
+def _daily_tss(session: Session, user_id: int, until: Optional[date] = None) -> list[tuple[date, float]]:
+    """(ride_date, total TSS) for each day with rides, oldest first — summed in SQL."""
+    query = select(Ride.ride_date, func.sum(Ride.tss)).where(Ride.user_id == user_id)
+    if until is not None:
+        query = query.where(Ride.ride_date <= until)
+    return session.exec(query.group_by(Ride.ride_date).order_by(Ride.ride_date)).all()
+
+
+def _week_start(column):
+    """SQL expression for the Monday starting the week of a date column."""
+    # Modifiers are inlined, not bound: Postgres only matches the SELECT and
+    # GROUP BY expressions if they render identically
+    if engine.dialect.name == "sqlite":
+        # 'weekday 0' moves to the coming Sunday (or stays on one)
+        return func.date(column, literal_column("'weekday 0'"), literal_column("'-6 days'"), type_=Date)
+    return cast(func.date_trunc(literal_column("'week'"), column), Date)
+
+
+def _tss_by_day(daily_rows: list[tuple[date, float]], start: date, end: date) -> np.ndarray:
+    """Dense daily TSS for start..end (rest days 0), indexed by days since start."""
+    tss = np.zeros((end - start).days + 1)
+    if daily_rows:
+        days, totals = zip(*daily_rows)
+        # Day offsets as one datetime64 subtraction rather than a Python loop
+        idx = (np.array(days, dtype="datetime64[D]") - np.datetime64(start, "D")).astype(np.int64)
+        tss[idx] = totals
+    return tss
+
+
+def _replay_load(daily_rows: list[tuple[date, float]], end: date) -> tuple[float, float]:
+    """
+    CTL/ATL on `end` from (ride_date, TSS) rows, oldest first, starting at 0.
+
+    Rest days only decay the loads, so each gap between ride days is applied
+    as one power — O(ride days) rather than a loop over every calendar day.
+    """
+    ctl = atl = 0.0
+    prev_day = None
+    for day, tss in daily_rows:
+        if prev_day is not None:
+            gap = (day - prev_day).days - 1
+            ctl *= CTL_DECAY ** gap
+            atl *= ATL_DECAY ** gap
+        ctl += (tss - ctl) / 42
+        atl += (tss - atl) / 7
+        prev_day = day
+    if prev_day is not None and end > prev_day:
+        gap = (end - prev_day).days
+        ctl *= CTL_DECAY ** gap
+        atl *= ATL_DECAY ** gap
+    return ctl, atl
+
+
+def _recompute_fitness_cache(session: Session, user: User):
+    """Rebuild the user's cached CTL/ATL from the full ride history (as of the last ride)."""
+    daily_rows = _daily_tss(session, user.id)
+    if not daily_rows:
+        user.cached_ctl, user.cached_atl, user.cached_fitness_date = 0.0, 0.0, None
+    else:
+        start, end = daily_rows[0][0], daily_rows[-1][0]
+        tss = _tss_by_day(daily_rows, start, end)
+        user.cached_ctl = float(calculate_load_series(tss, 42)[-1])
+        user.cached_atl = float(calculate_load_series(tss, 7)[-1])
+        user.cached_fitness_date = end
+    session.add(user)
+
+
+def _lock_user(session: Session, user_id: int) -> User:
+    """
+    Re-read a user row FOR UPDATE, refreshing the instance in the session.
+
+    get_current_user may hand back a cached copy of the row; anything that
+    writes user fields based on their current values reloads it first.
+    """
+    return session.exec(
+        select(User).where(User.id == user_id).with_for_update()
+        .execution_options(populate_existing=True)
+    ).one()
+
+
+def _update_fitness_cache(session: Session, user_id: int, changes: list[tuple[date, float]]):
+    """
+    Fold added (+TSS) or removed (-TSS) rides into the user's cached CTL/ATL.
+
+    CTL/ATL are linear in daily TSS, so a ride on day r changes the load on
+    day c >= r by tss/N * ((N-1)/N)^(c-r) — O(1) instead of a full replay.
+    Call after the ride rows are added/deleted, before the commit.
+    """
+    # Lock the row and reload it, so concurrent imports don't lose updates
+    user = _lock_user(session, user_id)
+    # Replay instead when there's no cache yet, or when the last ride day loses
+    # a ride — the cache date may then need to move back to an earlier ride
+    if user.cached_fitness_date is None or any(
+        tss < 0 and ride_date == user.cached_fitness_date for ride_date, tss in changes
+    ):
+        session.flush()
+        _recompute_fitness_cache(session, user)
+        return
+
+    ctl, atl, cache_date = user.cached_ctl, user.cached_atl, user.cached_fitness_date
+    for ride_date, tss in changes:
+        if ride_date > cache_date:
+            gap = (ride_date - cache_date).days
+            ctl *= CTL_DECAY ** gap
+            atl *= ATL_DECAY ** gap
+            cache_date = ride_date
+        lag = (cache_date - ride_date).days
+        ctl += tss / 42 * CTL_DECAY ** lag
+        atl += tss / 7 * ATL_DECAY ** lag
+
+    # Loads can't go negative; clamp float residue left by deletes
+    user.cached_ctl, user.cached_atl = max(ctl, 0.0), max(atl, 0.0)
+    user.cached_fitness_date = cache_date
+    session.add(user)
+
+
+def _current_fitness(user: User, today: date) -> tuple[float, float]:
+    """Cached CTL/ATL decayed (no rides) forward to today, or to the last ride if later."""
+    gap = max(0, (today - user.cached_fitness_date).days)
+    return user.cached_ctl * CTL_DECAY ** gap, user.cached_atl * ATL_DECAY ** gap
+
+
 # ═══════════════════════════════════════
 # AI RIDE ANALYSIS
 # ═══════════════════════════════════════
@@ -290,51 +525,47 @@ def _get_api_key() -> str:
     return os.environ.get("ANTHROPIC_API_KEY", "")
 
 
-def generate_ride_analysis(ride: Ride, user: User, session: Session) -> Optional[str]:
-    """Generate AI analysis for a ride."""
-    api_key = _get_api_key()
-    if not api_key:
-        return None
+ANALYSIS_SYSTEM_PROMPT = "You are VeloWatt AI Coach — a concise cycling performance analyst. Respond with 2-3 sentences only."
+
+ANALYSIS_PROMPT = """Analyze this cycling workout in 2-3 sentences. Be specific, data-driven, and coaching-oriented.
+
+RIDE:
+  Title: {ride.title}
+  Date: {ride.ride_date}
+  Duration: {duration_min}min
+  Avg Power: {ride.avg_power}W | NP: {np}W | Max: {max_power}W
+  TSS: {ride.tss} | IF: {ride.intensity_factor} | Zone: {zone_name}
+  HR: avg {avg_hr} / max {max_hr}
+  Distance: {distance}km | Elevation: {elevation}m
+  FTP: {ftp}W
+
+CURRENT FITNESS:
+  CTL: {ctl} | ATL: {atl} | TSB: {tsb}
+
+RECENT TRAINING:
+{recent}
+
+Give a brief, insightful analysis: what was the purpose of this ride, how it fits the recent training pattern, and one actionable suggestion. Keep it to 2-3 sentences max."""
 
-    ftp = user.ftp
 
+def _analysis_prompt(ride: Ride, user: User, session: Session) -> str:
+    """Fill ANALYSIS_PROMPT for a ride from its recent history."""
     recent = session.exec(
         select(Ride)
         .where(Ride.user_id == user.id)
         .where(Ride.ride_date <= ride.ride_date)
         .where(Ride.id != ride.id)
         .order_by(Ride.ride_date.desc())
-        .limit(7)
+        .limit(5)
     ).all()
 
-    all_rides = session.exec(
-        select(Ride)
-        .where(Ride.user_id == user.id)
-        .where(Ride.ride_date <= ride.ride_date)
-        .order_by(Ride.ride_date)
-    ).all()
-
-    daily_tss: dict = {}
-    for r in all_rides:
-        if r.ride_date in daily_tss:
-            daily_tss[r.ride_date] += r.tss
-        else:
-            daily_tss[r.ride_date] = r.tss
-
-    ctl = 0.0
-    atl = 0.0
-    if all_rides:
-        current = all_rides[0].ride_date
-        while current <= ride.ride_date:
-            day_tss = daily_tss.get(current, 0.0)
-            ctl = ctl + (day_tss - ctl) / 42
-            atl = atl + (day_tss - atl) / 7
-            current += timedelta(days=1)
+    ctl, atl = _replay_load(_daily_tss(session, user.id, until=ride.ride_date), ride.ride_date)
     tsb = ctl - atl
 
-    recent_lines = []
-    for r in recent[:5]:
-        recent_lines.append(f"  {r.ride_date} | {r.title} | {r.duration_seconds//60}min | Avg {r.avg_power}W | TSS {r.tss}")
+    recent_block = "\n".join(
+        f"  {r.ride_date} | {r.title} | {r.duration_seconds//60}min | Avg {r.avg_power}W | TSS {r.tss}"
+        for r in recent
+    ) or "  No recent rides"
 
     if_val = ride.intensity_factor
     if if_val < 0.55:
@@ -350,29 +581,46 @@ def generate_ride_analysis(ride: Ride, user: User, session: Session) -> Optional
     else:
         zone_name = "Anaerobic"
 
-    prompt = f"""Analyze this cycling workout in 2-3 sentences. Be specific, data-driven, and coaching-oriented.
+    return ANALYSIS_PROMPT.format(
+        ride=ride,
+        duration_min=ride.duration_seconds // 60,
+        np=ride.normalized_power or 'N/A',
+        max_power=ride.max_power or 'N/A',
+        zone_name=zone_name,
+        avg_hr=ride.avg_heart_rate or 'N/A',
+        max_hr=ride.max_heart_rate or 'N/A',
+        distance=ride.distance_km or 'N/A',
+        elevation=ride.elevation_gain_m or 'N/A',
+        ftp=user.ftp,
+        ctl=round(ctl, 1),
+        atl=round(atl, 1),
+        tsb=round(tsb, 1),
+        recent=recent_block,
+    )
 
-RIDE:
-  Title: {ride.title}
-  Date: {ride.ride_date}
-  Duration: {ride.duration_seconds // 60}min
-  Avg Power: {ride.avg_power}W | NP: {ride.normalized_power or 'N/A'}W | Max: {ride.max_power or 'N/A'}W
-  TSS: {ride.tss} | IF: {ride.intensity_factor} | Zone: {zone_name}
-  HR: avg {ride.avg_heart_rate or 'N/A'} / max {ride.max_heart_rate or 'N/A'}
-  Distance: {ride.distance_km or 'N/A'}km | Elevation: {ride.elevation_gain_m or 'N/A'}m
-  FTP: {ftp}W
 
-CURRENT FITNESS:
-  CTL: {round(ctl, 1)} | ATL: {round(atl, 1)} | TSB: {round(tsb, 1)}
+def generate_ride_analysis(ride: Ride, user: User, session: Session) -> Optional[str]:
+    """Generate AI analysis for a ride.
 
-RECENT TRAINING:
-{chr(10).join(recent_lines) if recent_lines else '  No recent rides'}
+    An existing summary is returned as-is unless a recalculate or FTP change
+    marked it stale. A stale summary is only regenerated if its prompt actually
+    changed: the prompt's hash is kept on the ride next to the summary.
+    """
+    if ride.ai_summary and not ride.ai_summary_stale:
+        return ride.ai_summary
 
-Give a brief, insightful analysis: what was the purpose of this ride, how it fits the recent training pattern, and one actionable suggestion. Keep it to 2-3 sentences max."""
+    api_key = _get_api_key()
+    if not api_key:
+        return None
+
+    prompt = _analysis_prompt(ride, user, session)
+    prompt_hash = hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+    if ride.ai_summary and ride.ai_prompt_hash == prompt_hash:
+        ride.ai_summary_stale = False
+        return ride.ai_summary
 
     try:
-        import httpx
-        response = httpx.post(
+        response = http_client.post(
             "https://api.anthropic.com/v1/messages",
             headers={
                 "x-api-key": api_key,
@@ -382,63 +630,106 @@ Give a brief, insightful analysis: what was the purpose of this ride, how it fit
             json={
                 "model": "claude-sonnet-4-20250514",
                 "max_tokens": 200,
-                "system": "You are VeloWatt AI Coach — a concise cycling performance analyst. Respond with 2-3 sentences only.",
+                "system": ANALYSIS_SYSTEM_PROMPT,
                 "messages": [{"role": "user", "content": prompt}],
             },
-            timeout=30,
         )
         if response.status_code == 200:
+            ride.ai_prompt_hash = prompt_hash
+            ride.ai_summary_stale = False
             return response.json()["content"][0]["text"]
     except Exception:
         pass
     return None
 
 
+def _store_analysis(session: Session, ride: Ride, analysis: Optional[str]) -> bool:
+    """Save generate_ride_analysis's result on the ride; True if the summary is new."""
+    fresh = analysis is not None and analysis != ride.ai_summary
+    if fresh:
+        ride.ai_summary = analysis
+    # Also covers a stale flag cleared without regenerating
+    if session.is_modified(ride):
+        session.add(ride)
+        session.commit()
+    return fresh
+
+
 @app.post("/api/rides/{ride_id}/analyze")
 def analyze_ride(
     ride_id: int,
     user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
-    ride = session.get(Ride, ride_id)
-    if not ride or ride.user_id != user.id:
+    ride = _get_user_ride(session, ride_id, user.id)
+    if not ride:
         raise HTTPException(status_code=404, detail="Ride not found")
 
+    # Regenerates only if a recalculate/FTP change altered the prompt
+    if _store_analysis(session, ride, generate_ride_analysis(ride, user, session)):
+        return {"ride_id": ride_id, "analysis": ride.ai_summary, "cached": False}
     if ride.ai_summary:
         return {"ride_id": ride_id, "analysis": ride.ai_summary, "cached": True}
-
-    analysis = generate_ride_analysis(ride, user, session)
-    if analysis:
-        ride.ai_summary = analysis
-        session.add(ride)
-        session.commit()
-        return {"ride_id": ride_id, "analysis": analysis, "cached": False}
     return {"ride_id": ride_id, "analysis": None, "error": "AI analysis unavailable"}
 
 
+@app.get("/api/rides/{ride_id}/ai_summary")
+def get_ride_ai_summary(
+    ride_id: int,
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """Poll for the summary written by the background analysis after an import."""
+    ride = _get_user_ride(session, ride_id, user.id)
+    if not ride:
+        raise HTTPException(status_code=404, detail="Ride not found")
+    pending = ride.ai_summary is None and bool(_get_api_key())
+    return {"ride_id": ride_id, "ai_summary": ride.ai_summary, "pending": pending}
+
+
+def _run_analysis(ride_id: int, user_id: int):
+    """Background task: generate and store the AI summary for a ride.
+
+    Runs after the response is sent, so it opens its own session.
+    """
+    if not _get_api_key():
+        return
+    with Session(engine) as session:
+        ride = session.get(Ride, ride_id)
+        user = session.get(User, user_id)
+        if not ride or not user or ride.ai_summary:
+            return
+        try:
+            analysis = generate_ride_analysis(ride, user, session)
+        except Exception:
+            return
+        _store_analysis(session, ride, analysis)
+
+
 @app.post("/api/rides/analyze-latest")
 def analyze_latest_ride(
     user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
-    ride = session.exec(
-        select(Ride)
-        .where(Ride.user_id == user.id)
-        .order_by(Ride.created_at.desc())
-        .limit(1)
-    ).first()
-    if not ride:
-        return {"analysis": None, "error": "No rides found"}
+    ride = session.get(Ride, user.latest_ride_id) if user.latest_ride_id else None
+    if ride is None:
+        # Latest ride predates latest_ride_id or was deleted — find it and remember it
+        ride = session.exec(
+            select(Ride)
+            .where(Ride.user_id == user.id)
+            .order_by(Ride.created_at.desc())
+            .limit(1)
+        ).first()
+        if not ride:
+            return {"analysis": None, "error": "No rides found"}
+        user.latest_ride_id = ride.id
+        session.add(user)
+        session.commit()
 
+    if _store_analysis(session, ride, generate_ride_analysis(ride, user, session)):
+        return {"ride_id": ride.id, "title": ride.title, "analysis": ride.ai_summary, "cached": False}
     if ride.ai_summary:
         return {"ride_id": ride.id, "title": ride.title, "analysis": ride.ai_summary, "cached": True}
-
-    analysis = generate_ride_analysis(ride, user, session)
-    if analysis:
-        ride.ai_summary = analysis
-        session.add(ride)
-        session.commit()
-        return {"ride_id": ride.id, "title": ride.title, "analysis": analysis, "cached": False}
     return {"ride_id": ride.id, "title": ride.title, "analysis": None, "error": "AI unavailable"}
 
 
@@ -448,73 +739,75 @@ def analyze_latest_ride(
 
 @app.get("/api/fitness")
 def get_fitness(
+    include_history: bool = True,
     user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
-    rides = session.exec(
-        select(Ride)
-        .where(Ride.user_id == user.id)
-        .order_by(Ride.ride_date)
-    ).all()
+    """
+    CTL/ATL/TSB history and 30-day forecast.
 
-    if not rides:
+    include_history=false answers from the cached loads on the user row
+    (no ride queries); peak_ctl then needs the history and is null.
+    """
+    if not include_history and user.cached_fitness_date is not None:
+        today = date.today()
+        ctl, atl = _current_fitness(user, today)
+        end = max(today, user.cached_fitness_date)
+        return {
+            "current_ctl": round(ctl, 1),
+            "current_atl": round(atl, 1),
+            "current_tsb": round(ctl - atl, 1),
+            "peak_ctl": None,
+            "history": [],
+            "forecast": _fitness_forecast(ctl, atl, end),
+        }
+
+    daily_rows = _daily_tss(session, user.id)
+
+    if not daily_rows:
         return {
             "current_ctl": 0, "current_atl": 0, "current_tsb": 0,
             "peak_ctl": 0, "history": [], "forecast": [],
         }
 
-    daily_tss: dict = {}
-    for ride in rides:
-        if ride.ride_date in daily_tss:
-            daily_tss[ride.ride_date] += ride.tss
-        else:
-            daily_tss[ride.ride_date] = ride.tss
-
-    start = rides[0].ride_date
-    end = max(date.today(), rides[-1].ride_date)
-
-    ctl = 0.0
-    atl = 0.0
-    peak_ctl = 0.0
-    history = []
-
-    current = start
-    while current <= end:
-        day_tss = daily_tss.get(current, 0.0)
-        ctl = ctl + (day_tss - ctl) / 42
-        atl = atl + (day_tss - atl) / 7
-        tsb = ctl - atl
-        peak_ctl = max(peak_ctl, ctl)
-        history.append({
-            "date": current.isoformat(),
-            "ctl": round(ctl, 1),
-            "atl": round(atl, 1),
-            "tsb": round(tsb, 1),
-        })
-        current += timedelta(days=1)
-
-    # 30-day forecast
-    forecast = []
-    fc_ctl, fc_atl = ctl, atl
-    for i in range(1, 31):
-        fc_ctl = fc_ctl + (0 - fc_ctl) / 42
-        fc_atl = fc_atl + (0 - fc_atl) / 7
-        fc_tsb = fc_ctl - fc_atl
-        forecast.append({
-            "date": (end + timedelta(days=i)).isoformat(),
-            "ctl": round(fc_ctl, 1),
-            "atl": round(fc_atl, 1),
-            "tsb": round(fc_tsb, 1),
-        })
-
-    return {
+    start = daily_rows[0][0]
+    end = max(date.today(), daily_rows[-1][0])
+
+    n_days = (end - start).days + 1
+    tss = _tss_by_day(daily_rows, start, end)
+    ctl_series = calculate_load_series(tss, 42)
+    atl_series = calculate_load_series(tss, 7)
+    dates = (np.datetime64(start) + np.arange(n_days)).astype(str).tolist()
+
+    history = [
+        {"date": d, "ctl": round(c, 1), "atl": round(a, 1), "tsb": round(c - a, 1)}
+        for d, c, a in zip(dates, ctl_series.tolist(), atl_series.tolist())
+    ] if include_history else []
+    ctl = float(ctl_series[-1])
+    atl = float(atl_series[-1])
+    peak_ctl = float(ctl_series.max())
+
+    # History can be thousands of entries — skip jsonable_encoder's walk over it
+    return ORJSONResponse({
         "current_ctl": round(ctl, 1),
         "current_atl": round(atl, 1),
         "current_tsb": round(ctl - atl, 1),
         "peak_ctl": round(peak_ctl, 1),
         "history": history,
-        "forecast": forecast,
-    }
+        "forecast": _fitness_forecast(ctl, atl, end),
+    })
+
+
+def _fitness_forecast(ctl: float, atl: float, end: date) -> list[dict]:
+    """30 days after `end` — with no more rides both loads just decay geometrically."""
+    days_ahead = np.arange(1, 31)
+    fc_ctl = (ctl * CTL_DECAY ** days_ahead).tolist()
+    fc_atl = (atl * ATL_DECAY ** days_ahead).tolist()
+    fc_dates = [(end + timedelta(days=i)).isoformat() for i in range(1, 31)]
+    return [
+        {"date": d, "ctl": round(c, 1), "atl": round(a, 1), "tsb": round(c - a, 1)}
+        for d, c, a in zip(fc_dates, fc_ctl, fc_atl)
+    ]
 
 
 # ═══════════════════════════════════════
@@ -535,24 +828,20 @@ def ftp_estimate(
     user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
-    rides_with_np = session.exec(
-        select(Ride)
-        .where(Ride.user_id == user.id)
-        .where(Ride.normalized_power != None)
-        .where(Ride.normalized_power > 0)
-        .order_by(Ride.ride_date)
-    ).all()
+    # Only the two maxima are needed, so let the database compute them
+    has_np = (Ride.user_id == user.id, Ride.normalized_power > 0)
+    best_long = session.scalar(
+        select(func.max(Ride.normalized_power))
+        .where(*has_np, Ride.duration_seconds >= 2400)
+    )
+    if best_long is not None:
+        est_ftp = round(best_long * 0.95, 1)
+        return {"estimated_ftp": est_ftp, "method": "95% of best 40min+ NP"}
 
-    if not rides_with_np:
+    best_np = session.scalar(select(func.max(Ride.normalized_power)).where(*has_np))
+    if best_np is None:
         return {"estimated_ftp": None, "method": "no data"}
 
-    long_rides = [r for r in rides_with_np if r.duration_seconds >= 2400]
-    if long_rides:
-        best_np = max(r.normalized_power for r in long_rides)
-        est_ftp = round(best_np * 0.95, 1)
-        return {"estimated_ftp": est_ftp, "method": "95% of best 40min+ NP"}
-
-    best_np = max(r.normalized_power for r in rides_with_np)
     est_ftp = round(best_np * 0.90, 1)
     return {"estimated_ftp": est_ftp, "method": "90% of best NP (short rides)"}
 
@@ -563,28 +852,29 @@ def ftp_estimate(
 
 @app.post("/api/import/fit")
 async def import_fit(
+    background: BackgroundTasks,
     file: UploadFile = File(...),
     user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
-    contents = await file.read()
-    fit_data = parse_fit_bytes(contents)
+    # Copy the upload to disk in chunks and hand the worker a path, rather
+    # than reading it into memory and pickling the bytes to the worker
+    with tempfile.NamedTemporaryFile(suffix=".fit", delete=False) as tmp:
+        await run_in_threadpool(shutil.copyfileobj, file.file, tmp, 1 << 16)
+    try:
+        fit_data = await parse_fit_file_async(tmp.name)
+    finally:
+        os.unlink(tmp.name)
 
     if not fit_data.power_data or fit_data.avg_power == 0:
         raise HTTPException(status_code=400, detail="No power data in FIT file")
 
     ftp = user.ftp
-    np_value = None
-    if len(fit_data.power_data) >= 30:
-        np_value = calculate_normalized_power(
-            fit_data.power_data, sample_rate_seconds=fit_data.sample_rate_seconds
-        )
-
     metrics = calculate_ride_metrics(
         duration_seconds=fit_data.duration_seconds,
         avg_power=fit_data.avg_power,
         ftp=ftp,
-        normalized_power=np_value,
+        normalized_power=fit_data.normalized_power,
         avg_heart_rate=fit_data.avg_heart_rate,
     )
 
@@ -612,20 +902,17 @@ async def import_fit(
         avg_cadence=fit_data.avg_cadence,
     )
     session.add(ride)
+    _update_fitness_cache(session, user.id, [(ride.ride_date, ride.tss)])
+    session.flush()
+    user.latest_ride_id = ride.id
+    session.add(user)
     session.commit()
     session.refresh(ride)
 
-    # Auto-analyze
-    try:
-        analysis = generate_ride_analysis(ride, user, session)
-        if analysis:
-            ride.ai_summary = analysis
-            session.add(ride)
-            session.commit()
-    except Exception:
-        pass
+    # Auto-analyze after responding; poll /api/rides/{id}/ai_summary for the result
+    background.add_task(_run_analysis, ride.id, user.id)
 
-    return {**ride.dict(), **metrics, "ai_summary": ride.ai_summary}
+    return ORJSONResponse({**ride.model_dump(), **metrics})
 
 
 # ═══════════════════════════════════════
@@ -633,14 +920,18 @@ async def import_fit(
 # ═══════════════════════════════════════
 
 @app.get("/api/strava/status")
-def strava_status(user: User = Depends(get_current_user)):
+def strava_status(
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
     client_id = os.environ.get("STRAVA_CLIENT_ID", "")
     client_secret = os.environ.get("STRAVA_CLIENT_SECRET", "")
 
     if not client_id or not client_secret:
         return {"configured": False, "connected": False, "message": "Strava not configured"}
 
-    if not user.strava_refresh_token:
+    token = session.get(OAuthToken, (user.id, "strava"))
+    if not token or not token.refresh_token:
         return {"configured": True, "connected": False, "message": "Click Connect Strava to authorize"}
 
     return {"configured": True, "connected": True, "message": "Connected to Strava"}
@@ -697,41 +988,34 @@ def strava_callback(
     session: Session = Depends(get_session),
 ):
     """Handle Strava OAuth callback — for both login and connect flows."""
-    import httpx
 
     client_id = os.environ.get("STRAVA_CLIENT_ID", "")
     client_secret = os.environ.get("STRAVA_CLIENT_SECRET", "")
 
     # Exchange code for tokens
-    resp = httpx.post("https://www.strava.com/oauth/token", data={
+    resp = http_client.post("https://www.strava.com/oauth/token", data={
         "client_id": client_id,
         "client_secret": client_secret,
         "code": code,
         "grant_type": "authorization_code",
-    }, timeout=30)
+    })
     resp.raise_for_status()
     tokens = resp.json()
 
     athlete = tokens.get("athlete", {})
     strava_id = athlete.get("id")
-    access_token = tokens["access_token"]
-    refresh_token = tokens["refresh_token"]
-    expires_at = tokens["expires_at"]
 
     # FLOW 1: Existing user connecting Strava (state = "connect_<user_id>")
     if state.startswith("connect_"):
         user_id = int(state.replace("connect_", ""))
         user = session.get(User, user_id)
         if user:
-            user.strava_access_token = access_token
-            user.strava_refresh_token = refresh_token
-            user.strava_expires_at = expires_at
-            if strava_id:
+            if strava_id and user.strava_athlete_id != strava_id:
                 user.strava_athlete_id = strava_id
-            session.add(user)
+                session.add(user)
+            _store_strava_tokens(session, user.id, tokens)
             session.commit()
 
-        from fastapi.responses import HTMLResponse
         return HTMLResponse(
             "<html><body style='font-family:Arial;text-align:center;padding:60px;background:#0f1117;color:#e6e6e6'>"
             "<h1 style='color:#16a34a'>⚡ Strava Connected!</h1>"
@@ -752,7 +1036,6 @@ def strava_callback(
             name = f"{first_name} {last_name}".strip() or "Cyclist"
 
             # Generate a random password hash (user won't need it — they login via Strava)
-            import secrets
             random_pass = secrets.token_hex(16)
 
             # Use strava athlete ID as pseudo-email if no email available
@@ -763,28 +1046,20 @@ def strava_callback(
                 password_hash=hash_password(random_pass),
                 name=name,
                 strava_athlete_id=strava_id,
-                strava_access_token=access_token,
-                strava_refresh_token=refresh_token,
-                strava_expires_at=expires_at,
                 ftp=200.0,
                 weight_kg=float(athlete.get("weight", 75) or 75),
             )
             session.add(user)
-            session.commit()
-            session.refresh(user)
-        else:
-            # Update tokens for existing user
-            user.strava_access_token = access_token
-            user.strava_refresh_token = refresh_token
-            user.strava_expires_at = expires_at
-            session.add(user)
-            session.commit()
+            session.flush()
+
+        _store_strava_tokens(session, user.id, tokens)
+        session.commit()
+        session.refresh(user)
 
         # Generate JWT token
         jwt_token = create_access_token(user.id, user.email)
 
         # Return HTML that stores token and redirects to app
-        from fastapi.responses import HTMLResponse
         return HTMLResponse(f"""<html><body style='font-family:Arial;text-align:center;padding:60px;background:#0f1117;color:#e6e6e6'>
             <h1 style='color:#f59e0b'>⚡ Welcome to VeloWatt!</h1>
             <p style='color:#8b8fa3'>Logging you in...</p>
@@ -795,7 +1070,6 @@ def strava_callback(
         </body></html>""")
 
     # Fallback
-    from fastapi.responses import HTMLResponse
     return HTMLResponse(
         "<html><body style='font-family:Arial;text-align:center;padding:60px;background:#0f1117;color:#e6e6e6'>"
         "<h1 style='color:#dc2626'>Something went wrong</h1>"
@@ -804,36 +1078,41 @@ def strava_callback(
     )
 
 
+def _store_strava_tokens(session: Session, user_id: int, tokens: dict):
+    """Upsert a user's Strava tokens from an OAuth token response (not committed)."""
+    token = session.get(OAuthToken, (user_id, "strava")) or OAuthToken(user_id=user_id, provider="strava")
+    token.access_token = tokens["access_token"]
+    token.refresh_token = tokens["refresh_token"]
+    token.expires_at = tokens["expires_at"]
+    session.add(token)
+
+
 def _get_strava_token(user: User, session: Session) -> Optional[str]:
     """Get valid Strava access token, refreshing if needed."""
-    import httpx
-    import time
-
-    if not user.strava_refresh_token:
+    token = session.get(OAuthToken, (user.id, "strava"))
+    if not token or not token.refresh_token:
         return None
 
     # Check if token is still valid
-    if user.strava_access_token and user.strava_expires_at and user.strava_expires_at > time.time():
-        return user.strava_access_token
+    if token.access_token and token.expires_at and token.expires_at > time.time():
+        return token.access_token
 
     # Refresh
     client_id = os.environ.get("STRAVA_CLIENT_ID", "")
     client_secret = os.environ.get("STRAVA_CLIENT_SECRET", "")
 
     try:
-        resp = httpx.post("https://www.strava.com/oauth/token", data={
+        resp = http_client.post("https://www.strava.com/oauth/token", data={
             "client_id": client_id,
             "client_secret": client_secret,
-            "refresh_token": user.strava_refresh_token,
+            "refresh_token": token.refresh_token,
             "grant_type": "refresh_token",
-        }, timeout=30)
+        })
         resp.raise_for_status()
         tokens = resp.json()
 
-        user.strava_access_token = tokens["access_token"]
-        user.strava_refresh_token = tokens["refresh_token"]
-        user.strava_expires_at = tokens["expires_at"]
-        session.add(user)
+        # Only the narrow token row is rewritten, not the user
+        _store_strava_tokens(session, user.id, tokens)
         session.commit()
 
         return tokens["access_token"]
@@ -841,61 +1120,79 @@ def _get_strava_token(user: User, session: Session) -> Optional[str]:
         return None
 
 
+STRAVA_SYNC_CONCURRENCY = int(os.environ.get("STRAVA_SYNC_CONCURRENCY", "8"))
+
+
+def _strava_imported_ids(session: Session, user_id: int) -> set[int]:
+    """Strava activity IDs already imported for a user."""
+    # Backfill strava_activity_id on legacy rides that only have it in the description
+    legacy_rides = session.exec(
+        select(Ride)
+        .where(Ride.user_id == user_id)
+        .where(Ride.strava_activity_id.is_(None))
+        .where(Ride.description.like("%strava_id:%"))
+    ).all()
+    for r in legacy_rides:
+        try:
+            sid = r.description.split("strava_id:")[1].split("|")[0].strip()
+            r.strava_activity_id = int(sid)
+            session.add(r)
+        except (ValueError, IndexError):
+            pass
+    if legacy_rides:
+        session.commit()
+
+    return set(session.exec(
+        select(Ride.strava_activity_id)
+        .where(Ride.user_id == user_id)
+        .where(Ride.strava_activity_id.is_not(None))
+    ).all())
+
+
 @app.post("/api/strava/sync")
-def strava_sync(
+async def strava_sync(
+    background: BackgroundTasks,
     user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
-    import httpx
+    # Read what's needed from the user up front: the threadpool helpers below
+    # may commit, which expires the row, and reloading it would then run
+    # blocking SQL on the event loop
+    user_id, ftp = user.id, user.ftp
 
-    access_token = _get_strava_token(user, session)
+    # DB work stays sync; run it in the threadpool so the event loop keeps serving
+    access_token = await run_in_threadpool(_get_strava_token, user, session)
     if not access_token:
         raise HTTPException(status_code=401, detail="Not connected to Strava")
 
-    ftp = user.ftp
+    already_imported = await run_in_threadpool(_strava_imported_ids, session, user_id)
+    auth_headers = {"Authorization": f"Bearer {access_token}"}
 
-    # Get already imported strava IDs (check both new field and legacy description)
-    user_rides = session.exec(select(Ride).where(Ride.user_id == user.id)).all()
-    already_imported = set()
-    for r in user_rides:
-        if r.strava_activity_id:
-            already_imported.add(r.strava_activity_id)
-        elif r.description and "strava_id:" in r.description:
-            try:
-                sid = r.description.split("strava_id:")[1].split("|")[0].strip()
-                sid_int = int(sid)
-                already_imported.add(sid_int)
-                # Backfill the proper field
-                r.strava_activity_id = sid_int
-                session.add(r)
-            except (ValueError, IndexError):
-                pass
-    session.commit()
+    imported = []
+    skipped = []
+    errors = []
+    new_rides: list[Ride] = []
 
     # Fetch ALL pages of activities
     activities = []
     page = 1
     per_page = 200  # Max allowed by Strava
-    with httpx.Client(timeout=30) as client:
-        while True:
-            resp = client.get(
-                "https://www.strava.com/api/v3/athlete/activities",
-                headers={"Authorization": f"Bearer {access_token}"},
-                params={"page": page, "per_page": per_page},
-            )
-            resp.raise_for_status()
-            batch = resp.json()
-            if not batch:
-                break
-            activities.extend(batch)
-            if len(batch) < per_page:
-                break
-            page += 1
-
-    imported = []
-    skipped = []
-    errors = []
-
+    while True:
+        resp = await async_http_client.get(
+            "https://www.strava.com/api/v3/athlete/activities",
+            headers=auth_headers,
+            params={"page": page, "per_page": per_page},
+        )
+        resp.raise_for_status()
+        batch = resp.json()
+        if not batch:
+            break
+        activities.extend(batch)
+        if len(batch) < per_page:
+            break
+        page += 1
+
+    to_import = []
     for act in activities:
         sport = act.get("sport_type", act.get("type", ""))
         if sport.lower() not in ("ride", "cycling", "virtualride", "ebikeride", "gravelride", "mountainbikeride"):
@@ -910,33 +1207,42 @@ def strava_sync(
             skipped.append({"name": act.get("name"), "reason": "no power data"})
             continue
 
+        already_imported.add(act_id)
+        to_import.append(act)
+
+    # Power streams for NP, fetched concurrently. HTTP/2 multiplexes them over
+    # one connection, so the semaphore is what bounds load on Strava.
+    limiter = asyncio.Semaphore(STRAVA_SYNC_CONCURRENCY)
+
+    async def fetch_stream(act_id: int):
+        async with limiter:
+            return await async_http_client.get(
+                f"https://www.strava.com/api/v3/activities/{act_id}/streams",
+                headers=auth_headers,
+                params={"keys": "watts", "key_by_type": "true"},
+            )
+
+    stream_responses = await asyncio.gather(
+        *(fetch_stream(act["id"]) for act in to_import), return_exceptions=True,
+    )
+
+    stream_np: list[Optional[float]] = []
+    for act, stream_resp in zip(to_import, stream_responses):
+        act_id = act["id"]
         try:
-            # Get power stream for NP
             np_value = None
             try:
-                stream_resp = httpx.get(
-                    f"https://www.strava.com/api/v3/activities/{act_id}/streams",
-                    headers={"Authorization": f"Bearer {access_token}"},
-                    params={"keys": "watts", "key_by_type": "true"},
-                    timeout=30,
-                )
-                if stream_resp.status_code == 200:
+                if not isinstance(stream_resp, BaseException) and stream_resp.status_code == 200:
                     stream_data = stream_resp.json()
                     if isinstance(stream_data, dict) and "watts" in stream_data:
-                        power_data = [float(w) for w in stream_data["watts"].get("data", [])]
+                        samples = stream_data["watts"].get("data", [])
+                        power_data = np.fromiter((float(w) for w in samples), dtype=np.float32, count=len(samples))
                         if len(power_data) >= 30:
-                            np_value = calculate_normalized_power(power_data)
+                            # CPU-bound over thousands of samples — keep it off the event loop
+                            np_value = await run_in_threadpool(calculate_normalized_power, power_data)
             except Exception:
                 pass
 
-            metrics = calculate_ride_metrics(
-                duration_seconds=int(act.get("moving_time", 0)),
-                avg_power=act.get("average_watts", 0),
-                ftp=ftp,
-                normalized_power=np_value,
-                avg_heart_rate=act.get("average_heartrate"),
-            )
-
             ride_date = None
             if act.get("start_date_local"):
                 try:
@@ -948,56 +1254,55 @@ def strava_sync(
             avg_speed = act.get("average_speed")
             avg_speed_kmh = round(avg_speed * 3.6, 1) if avg_speed else None
 
+            # Load metrics are filled in below, for the whole batch at once
             ride = Ride(
-                user_id=user.id,
+                user_id=user_id,
                 title=act.get("name", "Ride"),
                 ride_date=ride_date or date.today(),
                 description=f"strava_id:{act_id} | {act.get('device_name', 'Strava')}",
                 strava_activity_id=act_id,
                 duration_seconds=int(act.get("moving_time", 0)),
                 avg_power=act.get("average_watts", 0),
-                normalized_power=metrics["normalized_power"],
+                normalized_power=np_value or act.get("average_watts", 0),
                 max_power=act.get("max_watts"),
                 ftp_at_time=ftp,
                 avg_heart_rate=act.get("average_heartrate"),
                 max_heart_rate=act.get("max_heartrate"),
-                tss=metrics["tss"],
-                intensity_factor=metrics["intensity_factor"],
-                variability_index=metrics.get("variability_index"),
-                efficiency_factor=metrics.get("efficiency_factor"),
                 distance_km=distance_km,
                 elevation_gain_m=act.get("total_elevation_gain", 0),
                 avg_speed_kmh=avg_speed_kmh,
                 avg_cadence=int(act["average_cadence"]) if act.get("average_cadence") else None,
             )
-            session.add(ride)
-            session.commit()
+            new_rides.append(ride)
+            stream_np.append(np_value)
+        except Exception as e:
+            errors.append({"name": act.get("name"), "error": str(e)})
 
+    if new_rides:
+        metrics = calculate_ride_metrics_batch(
+            duration_seconds=[r.duration_seconds for r in new_rides],
+            avg_power=[r.avg_power for r in new_rides],
+            ftp=ftp,
+            normalized_power=stream_np,
+            avg_heart_rate=[r.avg_heart_rate for r in new_rides],
+        )
+        for i, ride in enumerate(new_rides):
+            ride.tss = float(metrics["tss"][i])
+            ride.intensity_factor = float(metrics["intensity_factor"][i])
+            ride.variability_index = float(metrics["variability_index"][i])
+            efficiency_factor = metrics["efficiency_factor"][i]
+            ride.efficiency_factor = None if np.isnan(efficiency_factor) else float(efficiency_factor)
             imported.append({
-                "name": act.get("name"),
-                "date": ride_date.isoformat() if ride_date else "",
-                "tss": metrics["tss"],
-                "np": metrics["normalized_power"],
+                "name": ride.title,
+                "date": ride.ride_date.isoformat(),
+                "tss": ride.tss,
+                "np": ride.normalized_power,
             })
-        except Exception as e:
-            errors.append({"name": act.get("name"), "error": str(e)})
 
-    # Auto-analyze latest
-    latest_analysis = None
-    if imported:
-        try:
-            latest_ride = session.exec(
-                select(Ride).where(Ride.user_id == user.id).order_by(Ride.created_at.desc()).limit(1)
-            ).first()
-            if latest_ride:
-                analysis = generate_ride_analysis(latest_ride, user, session)
-                if analysis:
-                    latest_ride.ai_summary = analysis
-                    session.add(latest_ride)
-                    session.commit()
-                    latest_analysis = {"ride": latest_ride.title, "analysis": analysis}
-        except Exception:
-            pass
+    latest_ride_id = await run_in_threadpool(_save_strava_rides, session, user, new_rides)
+    if latest_ride_id is not None:
+        # Auto-analyze latest after responding
+        background.add_task(_run_analysis, latest_ride_id, user_id)
 
     return {
         "total_found": len(activities),
@@ -1007,17 +1312,37 @@ def strava_sync(
         "imported_rides": imported,
         "skipped_rides": skipped,
         "error_details": errors,
-        "ai_analysis": latest_analysis,
+        "ai_analysis": None,
+        "analysis_ride_id": latest_ride_id,
     }
 
 
+def _save_strava_rides(session: Session, user: User, new_rides: list[Ride]) -> Optional[int]:
+    """Insert synced rides in one transaction; returns the latest ride's id."""
+    if not new_rides:
+        return None
+
+    # One transaction for the whole batch (multi-row INSERT on SQLAlchemy 2)
+    session.add_all(new_rides)
+    try:
+        session.flush()
+        _update_fitness_cache(session, user.id, [(r.ride_date, r.tss) for r in new_rides])
+        latest_ride_id = new_rides[-1].id
+        user.latest_ride_id = latest_ride_id
+        session.add(user)
+        session.commit()
+    except IntegrityError:
+        # ux_ride_user_strava — a concurrent sync inserted some of these first
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Strava sync already in progress, try again shortly")
+
+    return latest_ride_id
+
+
 # ═══════════════════════════════════════
 # AI COACH CHAT
 # ═══════════════════════════════════════
 
-from pydantic import BaseModel
-
-
 class ChatMessage(BaseModel):
     message: str
     history: list[dict] = []
@@ -1054,82 +1379,111 @@ def coach_status(
     }
 
 
-@app.post("/api/coach/chat")
-def coach_chat(
-    msg: ChatMessage,
-    user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
-):
-    api_key = _get_api_key()
-    if not api_key:
-        return {"response": "AI Coach is not configured. Contact admin.", "needs_api_key": True}
+def _use_coach_message(user: User, session: Session) -> Optional[dict]:
+    """Count a free-tier message; returns the limit reply if none are left this week."""
+    user = _lock_user(session, user.id)
+    today = date.today()
+    weekday = today.weekday()
+    week_start = today - timedelta(days=weekday)
 
-    # Check free tier limit
-    if not user.is_pro:
-        today = date.today()
-        week_start = today - timedelta(days=today.weekday())
-
-        if user.coach_week_start is None or user.coach_week_start < week_start:
-            user.coach_messages_used = 0
-            user.coach_week_start = week_start
-
-        if user.coach_messages_used >= FREE_COACH_LIMIT:
-            remaining_days = 7 - today.weekday()
-            return {
-                "response": f"⚡ You've used all {FREE_COACH_LIMIT} free AI Coach messages this week. Upgrade to Pro for unlimited coaching, or wait {remaining_days} days for your weekly reset.\n\nPro features:\n• Unlimited AI Coach conversations\n• Priority ride analysis\n• Advanced training insights",
-                "limit_reached": True,
-                "needs_api_key": False,
-            }
+    if user.coach_week_start is None or user.coach_week_start < week_start:
+        user.coach_messages_used = 0
+        user.coach_week_start = week_start
+
+    if user.coach_messages_used >= FREE_COACH_LIMIT:
+        remaining_days = 7 - weekday
+        return {
+            "response": f"⚡ You've used all {FREE_COACH_LIMIT} free AI Coach messages this week. Upgrade to Pro for unlimited coaching, or wait {remaining_days} days for your weekly reset.\n\nPro features:\n• Unlimited AI Coach conversations\n• Priority ride analysis\n• Advanced training insights",
+            "limit_reached": True,
+            "needs_api_key": False,
+        }
+
+    # Increment counter
+    user.coach_messages_used += 1
+    session.add(user)
+    session.commit()
+    return None
+
+
+@lru_cache(maxsize=256)
+def _zone_block(ftp: float) -> str:
+    """The POWER ZONES section of the coach prompt — the same text for a given FTP."""
+    return f"""POWER ZONES (FTP={ftp}W):
+  Z1 Recovery: <{round(ftp*0.55)}W | Z2 Endurance: {round(ftp*0.55)}-{round(ftp*0.75)}W
+  Z3 Tempo: {round(ftp*0.75)}-{round(ftp*0.90)}W | Z4 Threshold: {round(ftp*0.90)}-{round(ftp*1.05)}W
+  Z5 VO2max: {round(ftp*1.05)}-{round(ftp*1.20)}W | Z6 Anaerobic: >{round(ftp*1.20)}W"""
 
-        # Increment counter
-        user.coach_messages_used += 1
-        session.add(user)
-        session.commit()
 
+# Rendered coach prompts (user_id -> (key, context)). Back-to-back messages in
+# one conversation reuse the prompt; the key covers the user fields it shows and
+# the day, and any ride write drops the entry. Per-worker, bounded by the TTL.
+COACH_CONTEXT_TTL = int(os.environ.get("COACH_CONTEXT_TTL", "600"))
+_coach_context_cache = TTLCache(maxsize=1024, ttl=COACH_CONTEXT_TTL)
+_coach_context_lock = Lock()
+
+
+def invalidate_coach_context(user_id: int):
+    """Drop a user's cached coach prompt; needed after bulk Ride statements."""
+    with _coach_context_lock:
+        _coach_context_cache.pop(user_id, None)
+
+
+@event.listens_for(Ride, "after_insert")
+@event.listens_for(Ride, "after_update")
+@event.listens_for(Ride, "after_delete")
+def _on_ride_write(mapper, connection, target):
+    invalidate_coach_context(target.user_id)
+
+
+def _coach_context(user: User, session: Session) -> str:
+    """System prompt for the coach, served from the cache while it is current."""
+    key = (
+        date.today(), user.name, user.ftp, user.weight_kg, user.latest_ride_id,
+        user.cached_ctl, user.cached_atl, user.cached_fitness_date,
+    )
+    with _coach_context_lock:
+        cached = _coach_context_cache.get(user.id)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    context = _build_coach_context(user, session)
+    with _coach_context_lock:
+        _coach_context_cache[user.id] = (key, context)
+    return context
+
+
+def _build_coach_context(user: User, session: Session) -> str:
+    """System prompt for the coach: athlete profile plus current training data."""
     ftp = user.ftp
     weight = user.weight_kg
 
     recent_rides = session.exec(
-        select(Ride).where(Ride.user_id == user.id).order_by(Ride.ride_date.desc()).limit(20)
-    ).all()
-
-    all_rides = session.exec(
-        select(Ride).where(Ride.user_id == user.id).order_by(Ride.ride_date)
+        select(Ride).where(Ride.user_id == user.id).order_by(Ride.ride_date.desc()).limit(15)
     ).all()
 
-    # Calculate CTL/ATL
-    daily_tss: dict = {}
-    for ride in all_rides:
-        if ride.ride_date in daily_tss:
-            daily_tss[ride.ride_date] += ride.tss
-        else:
-            daily_tss[ride.ride_date] = ride.tss
-
-    ctl = 0.0
-    atl = 0.0
-    if all_rides:
-        current = all_rides[0].ride_date
-        end = max(date.today(), all_rides[-1].ride_date)
-        while current <= end:
-            day_tss = daily_tss.get(current, 0.0)
-            ctl = ctl + (day_tss - ctl) / 42
-            atl = atl + (day_tss - atl) / 7
-            current += timedelta(days=1)
+    # Decay the loads cached on the user row forward to today; only a user with
+    # no cache yet (no rides, or rides from before the cache) replays history
+    if user.cached_fitness_date is not None:
+        ctl, atl = _current_fitness(user, date.today())
+    else:
+        ctl, atl = _replay_load(_daily_tss(session, user.id), date.today())
     tsb = ctl - atl
 
-    ride_lines = []
-    for r in recent_rides[:15]:
-        ride_lines.append(
-            f"  {r.ride_date} | {r.title} | {r.duration_seconds//60}min | "
-            f"Avg {r.avg_power}W | NP {r.normalized_power}W | TSS {r.tss} | IF {r.intensity_factor}"
-        )
+    ride_block = "\n".join(
+        f"  {r.ride_date} | {r.title} | {r.duration_seconds//60}min | "
+        f"Avg {r.avg_power}W | NP {r.normalized_power}W | TSS {r.tss} | IF {r.intensity_factor}"
+        for r in recent_rides
+    ) or "  No rides yet"
 
-    weekly_tss = defaultdict(float)
-    for r in all_rides:
-        week_start = r.ride_date - timedelta(days=r.ride_date.weekday())
-        weekly_tss[week_start] += r.tss
-    sorted_weeks = sorted(weekly_tss.items(), reverse=True)[:4]
-    week_lines = [f"  Week of {w[0]}: TSS {round(w[1])}" for w in sorted_weeks]
+    # Weekly totals and the ride count come back aggregated, not as every ride
+    week = _week_start(Ride.ride_date)
+    recent_weeks = session.exec(
+        select(week, func.sum(Ride.tss))
+        .where(Ride.user_id == user.id)
+        .group_by(week).order_by(week.desc()).limit(4)
+    ).all()
+    week_lines = [f"  Week of {w[0]}: TSS {round(w[1])}" for w in recent_weeks]
+    total_rides = session.scalar(select(func.count(Ride.id)).where(Ride.user_id == user.id))
 
     context = f"""You are VeloWatt AI Coach — a professional cycling and strength coach for {user.name}.
 
@@ -1140,18 +1494,15 @@ CURRENT FITNESS:
   CTL (Fitness): {round(ctl, 1)}
   ATL (Fatigue): {round(atl, 1)}
   TSB (Form): {round(tsb, 1)}
-  Total rides: {len(all_rides)}
+  Total rides: {total_rides}
 
 RECENT RIDES:
-{chr(10).join(ride_lines) if ride_lines else '  No rides yet'}
+{ride_block}
 
 WEEKLY TSS:
 {chr(10).join(week_lines) if week_lines else '  No data'}
 
-POWER ZONES (FTP={ftp}W):
-  Z1 Recovery: <{round(ftp*0.55)}W | Z2 Endurance: {round(ftp*0.55)}-{round(ftp*0.75)}W
-  Z3 Tempo: {round(ftp*0.75)}-{round(ftp*0.90)}W | Z4 Threshold: {round(ftp*0.90)}-{round(ftp*1.05)}W
-  Z5 VO2max: {round(ftp*1.05)}-{round(ftp*1.20)}W | Z6 Anaerobic: >{round(ftp*1.20)}W
+{_zone_block(ftp)}
 
 YOUR COACHING EXPERTISE:
 You are a professional cycling and endurance sports coach with deep expertise in:
@@ -1180,6 +1531,26 @@ When creating gym workouts, provide:
 COMMUNICATION STYLE: Be direct, practical, and specific. Use the athlete's actual data when giving advice. Reference their CTL/ATL/TSB, recent rides, and power zones. When suggesting workouts, give exact power targets, durations, and intervals. Be encouraging but honest.
 
 SCOPE: Cycling, endurance sports, strength training for athletes, nutrition, and recovery. Politely redirect unrelated questions back to training."""
+    return context
+
+
+@app.post("/api/coach/chat")
+async def coach_chat(
+    msg: ChatMessage,
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    api_key = _get_api_key()
+    if not api_key:
+        return {"response": "AI Coach is not configured. Contact admin.", "needs_api_key": True}
+
+    # DB work stays sync, in the threadpool; the event loop only waits on Anthropic
+    if not user.is_pro:
+        limit_reply = await run_in_threadpool(_use_coach_message, user, session)
+        if limit_reply:
+            return limit_reply
+
+    context = await run_in_threadpool(_coach_context, user, session)
 
     messages = []
     for h in msg.history[-10:]:
@@ -1187,8 +1558,7 @@ SCOPE: Cycling, endurance sports, strength training for athletes, nutrition, and
     messages.append({"role": "user", "content": msg.message})
 
     try:
-        import httpx
-        response = httpx.post(
+        response = await async_http_client.post(
             "https://api.anthropic.com/v1/messages",
             headers={
                 "x-api-key": api_key,
@@ -1261,8 +1631,6 @@ def admin_stats(
     session: Session = Depends(get_session),
 ):
     """Dashboard stats: users, rides, AI usage."""
-    from sqlalchemy import func
-
     total_users = session.exec(select(func.count(User.id))).one()
     pro_users = session.exec(select(func.count(User.id)).where(User.is_pro == True)).one()
     total_rides = session.exec(select(func.count(Ride.id))).one()
@@ -1270,6 +1638,11 @@ def admin_stats(
 
     # Per-user breakdown
     users = session.exec(select(User).order_by(User.created_at.desc())).all()
+    strava_users = set(session.exec(
+        select(OAuthToken.user_id)
+        .where(OAuthToken.provider == "strava")
+        .where(OAuthToken.refresh_token != None)
+    ).all())
     user_list = []
     for u in users:
         ride_count = session.exec(select(func.count(Ride.id)).where(Ride.user_id == u.id)).one()
@@ -1282,7 +1655,7 @@ def admin_stats(
             "ftp": u.ftp,
             "rides": ride_count,
             "coach_used": u.coach_messages_used or 0,
-            "strava_connected": bool(u.strava_refresh_token),
+            "strava_connected": u.id in strava_users,
             "created_at": u.created_at.isoformat() if u.created_at else "",
         })
 
@@ -1354,19 +1727,23 @@ def admin_reset_password(
 # FRONTEND — Serve static HTML
 # ═══════════════════════════════════════
 
-from fastapi.responses import FileResponse, HTMLResponse
+# The pages ship with the app, so resolve and check them once at import
+STATIC_DIR = Path(__file__).parent / "static"
+INDEX_HTML = STATIC_DIR / "index.html"
+ADMIN_HTML = STATIC_DIR / "admin.html"
+HAS_INDEX_HTML = INDEX_HTML.exists()
+HAS_ADMIN_HTML = ADMIN_HTML.exists()
+
 
 @app.get("/")
 def serve_frontend():
-    static_path = Path(__file__).parent / "static" / "index.html"
-    if static_path.exists():
-        return FileResponse(static_path, media_type="text/html")
+    if HAS_INDEX_HTML:
+        return FileResponse(INDEX_HTML, media_type="text/html")
     return {"message": "VeloWatt API", "docs": "/docs"}
 
 
 @app.get("/admin")
 def serve_admin():
-    admin_path = Path(__file__).parent / "static" / "admin.html"
-    if admin_path.exists():
-        return FileResponse(admin_path, media_type="text/html")
+    if HAS_ADMIN_HTML:
+        return FileResponse(ADMIN_HTML, media_type="text/html")
     return {"message": "Admin page not found"}
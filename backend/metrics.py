@@ -14,10 +14,18 @@ Calculates key training metrics:
 """
 
 import math
+from bisect import bisect_right
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Optional
 
+import numpy as np
+from scipy.signal import lfilter
 
-def calculate_normalized_power(power_data: list[float], sample_rate_seconds: int = 1) -> float:
+import fit_numeric
+
+
+def calculate_normalized_power(power_data: list[float] | np.ndarray, sample_rate_seconds: int = 1) -> float:
     """
     Calculate Normalized Power (NP).
     
@@ -28,13 +36,13 @@ def calculate_normalized_power(power_data: list[float], sample_rate_seconds: int
     4. Take the 4th root
     
     Args:
-        power_data: List of power values in watts (one per sample)
+        power_data: Power values in watts (one per sample), as a list or array
         sample_rate_seconds: Seconds between each sample (default 1s)
     
     Returns:
         Normalized Power in watts
     """
-    if not power_data or len(power_data) < 30:
+    if power_data is None or len(power_data) < 30:
         return 0.0
 
     # Calculate window size for 30-second rolling average
@@ -43,22 +51,14 @@ def calculate_normalized_power(power_data: list[float], sample_rate_seconds: int
     if len(power_data) < window:
         return 0.0
 
-    # 30-second rolling average
-    rolling_avg = []
-    for i in range(window - 1, len(power_data)):
-        segment = power_data[i - window + 1: i + 1]
-        avg = sum(segment) / len(segment)
-        rolling_avg.append(avg)
-
-    if not rolling_avg:
-        return 0.0
-
-    # Raise to 4th power, average, then 4th root
-    fourth_powers = [p ** 4 for p in rolling_avg]
-    avg_fourth = sum(fourth_powers) / len(fourth_powers)
-    np_value = avg_fourth ** 0.25
+    # 30-second rolling average, 4th power, mean, 4th root — fused into one
+    # compiled pass when Numba is installed, a cumulative-sum NumPy pipeline otherwise.
+    # Samples are held as float32 like fit_parser's power_array (exact for whole
+    # watts, half the memory); the kernels accumulate in float64.
+    power = np.asarray(power_data, dtype=np.float32)
+    np_value = fit_numeric.normalized_power(power, window)
 
-    return round(np_value, 1)
+    return round(float(np_value), 1)
 
 
 def calculate_intensity_factor(normalized_power: float, ftp: float) -> float:
@@ -185,6 +185,18 @@ def calculate_atl(tss_history: list[float], days: int = 7) -> float:
     return round(atl, 1)
 
 
+def calculate_load_series(daily_tss: np.ndarray, days: int) -> np.ndarray:
+    """
+    CTL/ATL for every day of a dense daily TSS array (rest days = 0).
+    
+    Same recurrence as calculate_ctl / calculate_atl, starting from 0:
+    load_today = load_yesterday + (TSS_today - load_yesterday) / days
+    
+    which is a first-order IIR filter, so it runs in C via lfilter.
+    """
+    return lfilter([1 / days], [1, -(days - 1) / days], np.asarray(daily_tss, dtype=np.float64))
+
+
 def calculate_tsb(ctl: float, atl: float) -> float:
     """
     Calculate Training Stress Balance (TSB) — "Form".
@@ -205,7 +217,15 @@ def get_power_zones(ftp: float) -> list[dict]:
     Calculate 7 power zones based on FTP.
     
     Returns list of zones with name, min/max watts, and % FTP range.
+    The zones are computed once per FTP (which rarely changes); each call
+    gets its own copies, so callers may modify them.
     """
+    return [dict(zone) for zone in _power_zones(ftp)]
+
+
+@lru_cache(maxsize=256)
+def _power_zones(ftp: float) -> tuple[MappingProxyType, ...]:
+    """get_power_zones' cached table, as read-only mappings."""
     zones = [
         {"zone": 1, "name": "Active Recovery", "min_pct": 0, "max_pct": 0.55},
         {"zone": 2, "name": "Endurance", "min_pct": 0.55, "max_pct": 0.75},
@@ -220,44 +240,38 @@ def get_power_zones(ftp: float) -> list[dict]:
     for z in zones:
         min_watts = round(ftp * z["min_pct"])
         max_watts = round(ftp * z["max_pct"]) if z["max_pct"] else None
-        result.append({
+        result.append(MappingProxyType({
             "zone": z["zone"],
             "name": z["name"],
             "min_watts": min_watts,
             "max_watts": max_watts,
             "min_pct": round(z["min_pct"] * 100),
             "max_pct": round(z["max_pct"] * 100) if z["max_pct"] else None,
-        })
+        }))
+
+    return tuple(result)
 
-    return result
+
+# Label lookup tables: label i covers [breaks[i-1], breaks[i])
+_IF_BREAKS = (0.75, 0.85, 0.95, 1.05, 1.15)
+_IF_LABELS = ("Recovery", "Endurance", "Tempo", "Threshold", "VO2max", "Anaerobic")
+_TSS_BREAKS = (150, 300, 450)
+_TSS_LABELS = (
+    "Low — recovery within 24h",
+    "Medium — some fatigue next day",
+    "High — fatigue for ~2 days",
+    "Very high — fatigue for several days",
+)
 
 
 def get_ride_intensity_label(intensity_factor: float) -> str:
     """Return a human-readable label for the ride intensity."""
-    if intensity_factor < 0.75:
-        return "Recovery"
-    elif intensity_factor < 0.85:
-        return "Endurance"
-    elif intensity_factor < 0.95:
-        return "Tempo"
-    elif intensity_factor < 1.05:
-        return "Threshold"
-    elif intensity_factor < 1.15:
-        return "VO2max"
-    else:
-        return "Anaerobic"
+    return _IF_LABELS[bisect_right(_IF_BREAKS, intensity_factor)]
 
 
 def get_tss_recovery_label(tss: float) -> str:
     """Return estimated recovery time based on TSS."""
-    if tss < 150:
-        return "Low — recovery within 24h"
-    elif tss < 300:
-        return "Medium — some fatigue next day"
-    elif tss < 450:
-        return "High — fatigue for ~2 days"
-    else:
-        return "Very high — fatigue for several days"
+    return _TSS_LABELS[bisect_right(_TSS_BREAKS, tss)]
 
 
 def calculate_ride_metrics(
@@ -266,7 +280,7 @@ def calculate_ride_metrics(
     ftp: float,
     normalized_power: Optional[float] = None,
     avg_heart_rate: Optional[float] = None,
-    power_data: Optional[list[float]] = None,
+    power_data: Optional[list[float] | np.ndarray] = None,
     sample_rate_seconds: int = 1,
 ) -> dict:
     """
@@ -277,7 +291,7 @@ def calculate_ride_metrics(
     Otherwise, average power is used as an approximation.
     """
     # Determine NP
-    if power_data:
+    if power_data is not None and len(power_data) > 0:
         np_value = calculate_normalized_power(power_data, sample_rate_seconds)
     elif normalized_power:
         np_value = normalized_power
@@ -309,11 +323,72 @@ def calculate_ride_metrics(
     return result
 
 
+def _round_each(values: np.ndarray, ndigits: int) -> np.ndarray:
+    """
+    round() applied to each value of an array.
+    
+    np.round scales by 10**ndigits before rounding, so it can land on the
+    other side of a half-way point; the built-in keeps batch results
+    identical to the scalar calculate_* functions.
+    """
+    return np.fromiter((round(v, ndigits) for v in values.tolist()), dtype=np.float64, count=values.size)
+
+
+def calculate_ride_metrics_batch(
+    duration_seconds: np.ndarray,
+    avg_power: np.ndarray,
+    ftp: float,
+    normalized_power: Optional[np.ndarray] = None,
+    avg_heart_rate: Optional[np.ndarray] = None,
+) -> dict[str, np.ndarray]:
+    """
+    IF, TSS, VI and EF for many rides at once, as arrays.
+    
+    Same formulas and rounding as calculate_ride_metrics. Missing (NaN/None)
+    or zero NP falls back to average power; EF is NaN where there is no
+    heart rate.
+    """
+    duration = np.asarray(duration_seconds, dtype=np.float64)
+    avg = np.asarray(avg_power, dtype=np.float64)
+    if normalized_power is None:
+        np_arr = avg
+    else:
+        np_arr = np.asarray(normalized_power, dtype=np.float64)
+        np_arr = np.where(np.isnan(np_arr) | (np_arr == 0), avg, np_arr)
+
+    # Rides a formula doesn't apply to keep 0, as in the scalar functions
+    if_arr = np.zeros_like(np_arr)
+    tss = np.zeros_like(np_arr)
+    vi = np.zeros_like(np_arr)
+    if ftp > 0:
+        if_arr = _round_each(np_arr / ftp, 3)
+        timed = duration > 0
+        tss[timed] = _round_each(duration[timed] * np_arr[timed] * if_arr[timed] / (ftp * 3600) * 100, 1)
+    powered = avg > 0
+    vi[powered] = _round_each(np_arr[powered] / avg[powered], 2)
+
+    result = {
+        "normalized_power": np_arr,
+        "intensity_factor": if_arr,
+        "tss": tss,
+        "variability_index": vi,
+    }
+
+    if avg_heart_rate is not None:
+        hr = np.asarray(avg_heart_rate, dtype=np.float64)
+        ef = np.full_like(np_arr, np.nan)
+        ef[~np.isnan(hr) & (hr != 0)] = 0.0
+        with_hr = hr > 0
+        ef[with_hr] = _round_each(np_arr[with_hr] / hr[with_hr], 2)
+        result["efficiency_factor"] = ef
+
+    return result
+
+
 def format_duration(seconds: int) -> str:
     """Format seconds into H:MM:SS string."""
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    secs = seconds % 60
+    hours, rem = divmod(seconds, 3600)
+    minutes, secs = divmod(rem, 60)
     if hours > 0:
         return f"{hours}:{minutes:02d}:{secs:02d}"
     return f"{minutes}:{secs:02d}"
@@ -6,6 +6,7 @@ Multi-user with authentication.
 
 from datetime import datetime, date
 from typing import Optional
+from sqlalchemy import BigInteger, Column, Index, text
 from sqlmodel import SQLModel, Field, Relationship
 
 
@@ -28,16 +29,30 @@ class User(SQLModel, table=True):
     resting_hr: Optional[int] = Field(default=None)
     max_hr: Optional[int] = Field(default=None)
 
-    # Strava tokens
-    strava_refresh_token: Optional[str] = Field(default=None)
-    strava_access_token: Optional[str] = Field(default=None)
-    strava_expires_at: Optional[int] = Field(default=None)
+    # Strava link (tokens live in OAuthToken)
     strava_athlete_id: Optional[int] = Field(default=None, index=True)
 
     # AI Coach usage (free tier limits)
     coach_messages_used: int = Field(default=0)
     coach_week_start: Optional[date] = Field(default=None)
 
+    # CTL/ATL as of cached_fitness_date (last ride), kept current on ride writes
+    cached_ctl: Optional[float] = Field(default=None)
+    cached_atl: Optional[float] = Field(default=None)
+    cached_fitness_date: Optional[date] = Field(default=None)
+
+    # Most recently created ride, set on insert (no FK — ride already references user)
+    latest_ride_id: Optional[int] = Field(default=None)
+
+
+class OAuthToken(SQLModel, table=True):
+    """OAuth tokens for a linked provider — a narrow row, so refreshes don't rewrite User."""
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    provider: str = Field(primary_key=True)  # "strava"
+    access_token: Optional[str] = Field(default=None)
+    refresh_token: Optional[str] = Field(default=None)
+    expires_at: Optional[int] = Field(default=None)
+
 
 class UserSettings(SQLModel, table=True):
     """Legacy user settings — kept for backward compatibility during migration."""
@@ -55,6 +70,21 @@ class UserSettings(SQLModel, table=True):
 
 class Ride(SQLModel, table=True):
     """A single ride/workout record."""
+    __table_args__ = (
+        # Every list/fitness query filters by user and orders by date
+        Index("ix_ride_user_date", "user_id", "ride_date"),
+        # analyze-latest's fallback finds a user's newest ride by created_at
+        Index("ix_ride_user_created", "user_id", "created_at"),
+        # FTP estimate only looks at rides with NP
+        Index(
+            "ix_ride_np", "user_id", "normalized_power",
+            postgresql_where=text("normalized_power IS NOT NULL"),
+            sqlite_where=text("normalized_power IS NOT NULL"),
+        ),
+        # A Strava activity can only be imported once per user (NULLs don't clash)
+        Index("ux_ride_user_strava", "user_id", "strava_activity_id", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
 
     # Owner
@@ -92,7 +122,10 @@ class Ride(SQLModel, table=True):
 
     # Metadata
     ai_summary: Optional[str] = Field(default=None)
-    strava_activity_id: Optional[int] = Field(default=None, index=True)
+    ai_prompt_hash: Optional[str] = Field(default=None)  # blake2b of the prompt behind ai_summary
+    ai_summary_stale: bool = Field(default=False)  # metrics/FTP changed since ai_summary was written
+    # Strava activity ids are past 2**31, so the column is 64-bit
+    strava_activity_id: Optional[int] = Field(default=None, sa_column=Column(BigInteger, index=True))
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 